@@ -7,10 +7,26 @@ import time
 import glob
 import shutil
 import subprocess # Added for adding commands to console
+import argparse
+import socket
+import threading
+import multiprocessing
+import Queue
 from datetime import datetime
 from tabulate import tabulate
 from CameraController.device.camera import Camera
 from CameraController.device.cameralog import CameraLog #Added to access camera logs from camera controller function
+import camera_pool
+from gss_parser import GssStatus, parse_gss, format_uptime
+from status_store import StatusStore
+from status_output import make_writer
+from sim_camera import simulated_camera_factory
+from fleet_inventory import read_inventory, parse_shard, merge_ndjson
+from camera_log_reader import SystemLogReader
+from avigilon_console import run_console_script, ConsoleCommandError, VAL_DEBUG_SCRIPT
+
+HEADERS=["IP","Model","FW Version","Uptime","SysCpu","ProcCpu","SysMem","ValService","VAL EXCEPTION","Log Wait (s)"]
+VAL_EXCEPTION_COLUMN=HEADERS.index("VAL EXCEPTION")
 
 
 def logging_info(msg):
@@ -18,121 +34,415 @@ def logging_info(msg):
     print (msg)
 
 
-def printCamStatus(ip, camera, data):
+def printCamStatus(ip, camera, data, quietWindow=10, maxLogWait=100, consoleBatch=False):
 
     camData=[]
     camData.append(ip)
     camData.append(camera.cp.props.get('Model'))
     camData.append(camera.cp.props.get('FirmwareVersion'))
 
-    info = data.split('\n')
+    status = data if isinstance(data, GssStatus) else parse_gss(data)
     # Print camera's uptime in human syntax
-    info[0] = info[0].strip()
-    info[0] = info[0].replace('Rel ', '')
-    info[0] = info[0].replace('d', ' days ')
-    info[0] = info[0].replace('h', ' hours ')
-    info[0] = info[0].replace('m', ' minutes ')
-    info[0] = re.sub(r'\ds', ' seconds ', info[0])
-
-    camData.append(info[0])
-    # Print camera load
-    perf = info[2].split(',')
-    cpu1=perf[0].strip()+","+perf[1].strip()
-    cpu1=cpu1.replace('SysCpu ','')
-    camData.append(cpu1)
-
-    cpu2=perf[3].strip()
-    cpu2=cpu2.replace('ProcCpu ','')
-    camData.append(cpu2)
-
-    mem=perf[4].strip().replace('SysMem ','')
-    camData.append(mem)
-
-    # Look for ValService performance
-    for i in range(4, len(info)):
-        match = re.search('ValService', info[i])
-        if match:
-            valService=info[i].strip()
-            valService=valService.replace('-- ValService','')
-            valService = re.sub(r'\d+\s\:\s','',valService)
-            valService = re.sub(r'\sPrio\s.+','',valService)
-            camData.append(valService)
-            break
-		
-# Adding code to activate logger levels for capturing system logs and checking VAL Exception		
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'logger')
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'sll %s %s' % ("Vas.ValService", "DEBUG"))
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'exit')
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'vas')
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'evs %s' % ("10"))
-    camera.avigilon_client.client.service.ExecuteConsoleCmd(0, 'exit')
-    time.sleep(100)
-	
+    camData.append(format_uptime(status.uptime))
+    # Print camera load as the camera prints it
+    camData.append(status.sys_cpu_text or "")
+    camData.append(status.proc_cpu_text or "")
+    camData.append(status.sys_mem_text or "")
+    # ValService performance
+    camData.append(status.val_service or "")
+
+# Adding code to activate logger levels for capturing system logs and checking VAL Exception
+    try:
+        run_console_script(camera.avigilon_client, VAL_DEBUG_SCRIPT, batch=consoleBatch)
+    except ConsoleCommandError as e:
+        logging.warning("Camera %s: %s", ip, e)
+
     if camera.event_client is None:
        camera.create_event_client()
 
     if camera.avigilon_client is None:
        camera.create_avigilon_client()
-		
-    logs=camera.camera_log.get_system_logs()
-	 
-    err = "VAL::EXCEPTION"
-    valException = "NONE"
-    for data in logs:
-	    if (data.find(err) != -1):
-		    valException = data
-	  	    break
-   
-    camData.append(valException)     
+
+    valException, logWait = waitForValException(ip, camera, quietWindow, maxLogWait)
+
+    camData.append(valException)
+    camData.append("%.1f" % logWait)
     return camData;
 
-def main(argv):
 
-    camFile = argv[1]
-    cams=[]
-    if (len(argv) != 2 ):
-        logging.warning("Wrong arguments number. Configuration file full path has to be defined.")
-        exit(-1)
-    try:    #read and parse config file (IP,User,Passwd )
+def waitForValException(ip, camera, quietWindow=10, maxLogWait=100, pollTime=2):
+    """
+    Watch camera system logs until VAL::EXCEPTION shows up, no new log lines
+    arrive for quietWindow seconds, or maxLogWait seconds pass
+    :param ip: camera IP, key of the system log cursor
+    :param camera: Camera object with DEBUG logging enabled for Vas.ValService
+    :param quietWindow: seconds without new log lines after which capture stops
+    :param maxLogWait: upper bound for the capture in seconds
+    :param pollTime: seconds between system log reads
+    :return: (log line with the exception or "NONE", seconds spent waiting)
+    """
+    err = "VAL::EXCEPTION"
+    reader = SystemLogReader.for_camera(ip, camera.camera_log)
+    start = time.time()
+    lastChange = start
+    lastCursor = -1
+    while True:
+        valException = reader.find(err)
+        if valException is not None:
+            return valException, time.time() - start
+
+        now = time.time()
+        if reader.cursor != lastCursor:
+            lastCursor = reader.cursor
+            lastChange = now
+        if now - lastChange >= quietWindow or now - start >= maxLogWait:
+            return "NONE", now - start
+        # wake up when the quiet window or the capture limit runs out, whichever comes first
+        time.sleep(min(pollTime, max(maxLogWait - (now - start), 0), max(quietWindow - (now - lastChange), 0)))
+
+
+def getCamStatus(credentials, progress=None, withStatus=False, **statusOptions):
+    """
+    Create camera object, read its gss output and build one StatusTable row
+    :param credentials: [IP, User, Passwd] list from the inventory file
+    :param progress: optional dict used by collectFleetStatus to follow the current phase
+    :param withStatus: also return the parsed gss record
+    :param statusOptions: quietWindow, maxLogWait and consoleBatch options of printCamStatus
+    :return: row for StatusTable, (row, GssStatus) if withStatus, or None if camera could not be queried
+    """
+    def phase(name):
+        if progress is not None:
+            progress['phase'] = name
+            progress['started'] = time.time()
+
+    phase('connect')
+    try: #Create camera object
+        print >> sys.stderr, "Try to create camera object with the following params: " + credentials[0] + "," + credentials[1] + "," + credentials[2]
+        camObject=camera_pool.get_camera(credentials[1],credentials[2],credentials[0])
+    except:
+        logging.warning( "Failed to create camera object ip: %s, user: %s, password: %s",credentials[0],credentials[1],credentials[2])
+        return None
 
-        f= open(camFile, 'rU')
-        for line in f:
-            line=line.strip()
-            cams.append(line)
-        f.close()
+    phase('command')
+    try:
+        gssOutput = camObject.avigilon_client.gss()
+    except:
+        logging.warning("Error in getting camera " + credentials[0] + "status " )
+        camera_pool.discard(credentials[1],credentials[2],credentials[0])
+        return None
 
+    try:
+        status = parse_gss(gssOutput['Output'])
+        camData = printCamStatus(credentials[0], camObject, status, **statusOptions)
+        return (camData, status) if withStatus else camData
     except:
+        logging.warning("Error in processing camera " + credentials[0] + " status")
+        camera_pool.discard(credentials[1],credentials[2],credentials[0])
+        return None
+
+
+def collectFleetStatus(cams, workers=1, connectTimeout=60, commandTimeout=300, onRow=None, keepRows=True,
+                       **statusOptions):
+    """
+    Query cameras concurrently and return StatusTable rows in inventory order.
+    Each camera runs in its own daemon thread, at most 'workers' at a time.
+    A camera that stays longer than connectTimeout in camera object creation or
+    commandTimeout in status commands is abandoned and its row skipped. Its
+    thread keeps its worker slot until it exits, so no more than 'workers'
+    threads talk to cameras at any time.
+    :param cams: iterable of [IP, User, Passwd] lists, consumed lazily
+    :param workers: number of cameras queried at the same time
+    :param connectTimeout: seconds allowed for creating the camera object
+    :param commandTimeout: seconds allowed for gss and log commands
+    :param onRow: optional callable getting each row as soon as its camera completes
+    :param keepRows: collect rows for the return value, disable for constant memory streaming
+    :param statusOptions: quietWindow, maxLogWait and consoleBatch options of printCamStatus
+    :return: list of StatusTable rows (empty if keepRows is False)
+    """
+    done = Queue.Queue()
+    pending = enumerate(cams)
+    exhausted = False
+    running = {}
+    abandoned = {}
+    rows = {}
+
+    def worker(index, credentials, progress):
+        done.put((index, getCamStatus(credentials, progress, **statusOptions)))
+
+    while not exhausted or running:
+        pruneAbandoned(abandoned)
+        while not exhausted and len(running) + len(abandoned) < max(workers, 1):
+            try:
+                index, credentials = next(pending)
+            except StopIteration:
+                exhausted = True
+                break
+            progress = {'phase': 'connect', 'started': time.time(), 'ip': credentials[0],
+                        'credentials': credentials}
+            t = threading.Thread(target=worker, args=(index, credentials, progress))
+            t.daemon = True
+            t.start()
+            progress['thread'] = t
+            running[index] = progress
+
+        try:
+            index, camData = done.get(timeout=0.5)
+            abandoned.pop(index, None)
+            if index in running:
+                del running[index]
+                if camData is not None:
+                    if onRow is not None:
+                        onRow(camData)
+                    if keepRows:
+                        rows[index] = camData
+        except Queue.Empty:
+            pass
+
+        now = time.time()
+        for index, progress in list(running.items()):
+            limit = connectTimeout if progress['phase'] == 'connect' else commandTimeout
+            if now - progress['started'] > limit:
+                logging.warning("Camera %s timed out after %d seconds in %s phase, skipping",
+                                progress['ip'], limit, progress['phase'])
+                credentials = progress['credentials']
+                camera_pool.discard(credentials[1], credentials[2], credentials[0])
+                abandoned[index] = running.pop(index)['thread']
+
+    return [rows[index] for index in sorted(rows)]
+
+
+def pruneAbandoned(abandoned):
+    """
+    Forget abandoned threads that have exited, the others still hold a worker slot
+    :param abandoned: dict index -> Thread of timed out cameras
+    """
+    for index, t in list(abandoned.items()):
+        if not t.is_alive():
+            del abandoned[index]
+
+
+def monitorFleet(cams, store, interval=300, workers=8, connectTimeout=60, commandTimeout=300, **statusOptions):
+    """
+    Poll cameras every 'interval' seconds forever and append samples to store.
+    A camera whose previous poll is still running is skipped until that poll
+    ends. Polls over the connect/command timeout are abandoned, their thread
+    keeps its worker slot and the camera stays skipped while it is alive.
+    :param cams: list of [IP, User, Passwd] lists
+    :param store: StatusStore receiving the samples
+    :param interval: seconds between polls of one camera
+    :param workers: number of cameras queried at the same time
+    :param connectTimeout: seconds allowed for creating the camera object
+    :param commandTimeout: seconds allowed for gss and log commands
+    :param statusOptions: quietWindow, maxLogWait and consoleBatch options of printCamStatus
+    """
+    done = Queue.Queue()
+    inventory = list(cams)
+    nextDue = [time.time()] * len(inventory)
+    running = {}
+    abandoned = {}
+
+    def worker(index, credentials, progress, started):
+        done.put((index, started, getCamStatus(credentials, progress, withStatus=True, **statusOptions)))
+
+    while True:
+        pruneAbandoned(abandoned)
+        now = time.time()
+        for index, credentials in enumerate(inventory):
+            if nextDue[index] > now or len(running) + len(abandoned) >= max(workers, 1):
+                continue
+            # keep the schedule but never queue up missed polls
+            nextDue[index] = max(nextDue[index] + interval, now)
+            if index in running or index in abandoned:
+                logging.warning("Camera %s previous poll still running, skipping", credentials[0])
+                continue
+            progress = {'phase': 'connect', 'started': now, 'ip': credentials[0], 'credentials': credentials}
+            t = threading.Thread(target=worker, args=(index, credentials, progress, now))
+            t.daemon = True
+            t.start()
+            progress['thread'] = t
+            running[index] = progress
+
+        try:
+            index, started, result = done.get(timeout=0.5)
+            while True:
+                running.pop(index, None)
+                abandoned.pop(index, None)
+                if result is not None:
+                    camData, status = result
+                    store.add(started, camData[0], status, camData[VAL_EXCEPTION_COLUMN])
+                index, started, result = done.get_nowait()
+        except Queue.Empty:
+            pass
+        store.flush()
+
+        now = time.time()
+        for index, progress in list(running.items()):
+            limit = connectTimeout if progress['phase'] == 'connect' else commandTimeout
+            if now - progress['started'] > limit:
+                logging.warning("Camera %s timed out after %d seconds in %s phase",
+                                progress['ip'], limit, progress['phase'])
+                credentials = progress['credentials']
+                camera_pool.discard(credentials[1], credentials[2], credentials[0])
+                abandoned[index] = running.pop(index)['thread']
+
+
+def runShard(camFile, shard, shards, rowQueue, collectOptions):
+    """
+    Process entry point of collectSharded, sends rows of one shard to rowQueue
+    and None when the shard is done
+    """
+    try:
+        collectFleetStatus(read_inventory(camFile, shard, shards), onRow=rowQueue.put, keepRows=False,
+                           **collectOptions)
+    finally:
+        rowQueue.put(None)
+
+
+def collectSharded(camFile, processes, onRow=None, keepRows=True, **collectOptions):
+    """
+    Split inventory into 'processes' shards and query each shard in its own process
+    :param camFile: inventory file
+    :param processes: number of worker processes (and shards)
+    :param onRow: optional callable getting each row as soon as its camera completes
+    :param keepRows: collect rows for the return value
+    :param collectOptions: options of collectFleetStatus
+    :return: list of StatusTable rows sorted by IP (empty if keepRows is False)
+    """
+    rowQueue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=runShard, args=(camFile, shard, processes, rowQueue, collectOptions))
+             for shard in range(processes)]
+    for proc in procs:
+        proc.daemon = True
+        proc.start()
+
+    rows = []
+    finished = 0
+    while finished < processes:
+        try:
+            camData = rowQueue.get(timeout=1)
+        except Queue.Empty:
+            if not any(proc.is_alive() for proc in procs):
+                logging.warning("Shard process exited without finishing its shard")
+                break
+            continue
+        if camData is None:
+            finished += 1
+            continue
+        if onRow is not None:
+            onRow(camData)
+        if keepRows:
+            rows.append(camData)
+
+    for proc in procs:
+        proc.join()
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Print status of cameras listed in configuration file")
+    parser.add_argument('camFile', nargs='+',
+                        help="configuration file full path, one 'IP,User,Passwd' per line "
+                             "(NDJSON shard outputs with --merge)")
+    parser.add_argument('--workers', type=int, default=1, help="number of cameras queried concurrently")
+    parser.add_argument('--connect-timeout', type=float, default=60,
+                        help="seconds allowed for creating a camera object")
+    parser.add_argument('--command-timeout', type=float, default=300,
+                        help="seconds allowed for status commands on one camera")
+    parser.add_argument('--quiet-window', type=float, default=10,
+                        help="stop log capture after this many seconds without new log lines")
+    parser.add_argument('--max-log-wait', type=float, default=100,
+                        help="upper bound in seconds for VAL exception log capture")
+    parser.add_argument('--batch-console', action='store_true',
+                        help="experimental: send console setup commands in one request, "
+                             "falls back to one request per command if the reply cannot be split")
+    parser.add_argument('--output', choices=['grid', 'ndjson', 'csv'], default='grid',
+                        help="grid prints one table at the end, ndjson and csv stream each row as it completes")
+    parser.add_argument('--summary', action='store_true',
+                        help="with ndjson or csv output also print the grid at the end (to stderr)")
+    parser.add_argument('--shard', default='0/1',
+                        help="only query cameras of shard i out of N (i/N), cameras are assigned by IP hash")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="split the inventory into this many shards, each queried by its own process")
+    parser.add_argument('--merge', action='store_true',
+                        help="combine NDJSON shard outputs given as arguments into one report")
+    parser.add_argument('--simulate', action='store_true',
+                        help="query simulated cameras (sim_camera.py) instead of real hardware, for benchmarking")
+    parser.add_argument('--sim-latency', type=float, default=0.05, help="simulated seconds per request")
+    parser.add_argument('--sim-jitter', type=float, default=0.02, help="simulated +- seconds of request latency")
+    parser.add_argument('--sim-failure-rate', type=float, default=0.0, help="simulated request failure probability")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep polling the fleet and store samples in --db instead of printing a table")
+    parser.add_argument('--interval', type=float, default=300, help="seconds between polls of a camera in daemon mode")
+    parser.add_argument('--db', default='camera_status.db', help="SQLite file for daemon mode samples")
+    parser.add_argument('--wsdl-cache', action='store_true',
+                        help="keep parsed WSDLs for %d days in %s" % (camera_pool.WSDL_CACHE_DAYS,
+                                                                      camera_pool.WSDL_CACHE_DIR))
+    args = parser.parse_args(argv[1:])
+
+    onRow = None
+    if args.output != 'grid':
+        onRow = make_writer(args.output, sys.stdout, HEADERS).write
+
+    if args.merge:
+        StatusTable = merge_ndjson(args.camFile, HEADERS)
+        if onRow is not None:
+            for camData in StatusTable:
+                onRow(camData)
+        else:
+            print tabulate(StatusTable,HEADERS,tablefmt="grid")
+        return
+
+    if len(args.camFile) != 1:
+        parser.error("Configuration file full path has to be defined.")
+    camFile = args.camFile[0]
+    try:
+        shard, shards = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+    if shards > 1 and args.processes > 1:
+        parser.error("--shard and --processes can not be combined")
+    if not os.path.isfile(camFile):
         logging.warning("Error in reading input file " + camFile )
         exit(-1)
 
-    StatusTable=[]
-    headers=["IP","Model","FW Version","Uptime","SysCpu","ProcCpu","SysMem","ValService","VAL EXCEPTION"]
-
-    for cam in cams:
-        credentials=cam.split(',')
-        try: #Create camera object
-            print "Try to create camera object with the following params: " + credentials[0] + "," + credentials[1] + "," + credentials[2]
-            camObject=Camera(credentials[1],credentials[2],credentials[0])
-    #    camera.cp.print_camera_properties()
-        except:
-            logging.warning( "Failed to create camera object ip: %s, user: %s, password: %s",credentials[0],credentials[1],credentials[2])
-            continue
+    if args.wsdl_cache:
+        camera_pool.enable_wsdl_cache()
+    if args.simulate:
+        camera_pool.default_pool.camera_factory = simulated_camera_factory(
+            latency=args.sim_latency, jitter=args.sim_jitter, failure_rate=args.sim_failure_rate)
+
+    # Socket level timeout so that unreachable cameras fail instead of hanging a worker forever
+    socket.setdefaulttimeout(args.connect_timeout)
+    collectOptions = dict(workers=args.workers, connectTimeout=args.connect_timeout,
+                          commandTimeout=args.command_timeout, quietWindow=args.quiet_window,
+                          maxLogWait=args.max_log_wait, consoleBatch=args.batch_console)
 
+    if args.daemon:
+        store = StatusStore(args.db)
         try:
-            gssOutput = camObject.avigilon_client.gss()
-        except:
-            logging.warning("Error in getting camera " + credentials[0] + "status " )
-            continue
-    #print gssOutput['Output']
+            monitorFleet(list(read_inventory(camFile, shard, shards)), store, args.interval, **collectOptions)
+        finally:
+            store.close()
+        return
 
-        camData=printCamStatus(credentials[0], camObject, gssOutput['Output'])
-        StatusTable.append(camData)
+    keepRows = args.output == 'grid' or args.summary
+    if args.processes > 1:
+        StatusTable=collectSharded(camFile, args.processes, onRow=onRow, keepRows=keepRows, **collectOptions)
+    else:
+        StatusTable=collectFleetStatus(read_inventory(camFile, shard, shards), onRow=onRow, keepRows=keepRows,
+                                       **collectOptions)
+    if args.output != 'grid':
+        if args.summary:
+            print >> sys.stderr, tabulate(StatusTable,HEADERS,tablefmt="grid")
+        return
 
     timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M")
     #outfile = "C:\\Logs\cameras_"+timestamp+".txt"
     #f1=open(outfile,'w')
-    #print >> f1, tabulate(StatusTable,headers,tablefmt="grid")
-    print tabulate(StatusTable,headers,tablefmt="grid")
+    #print >> f1, tabulate(StatusTable,HEADERS,tablefmt="grid")
+    print tabulate(StatusTable,HEADERS,tablefmt="grid")
 
 
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Run console command scripts through avigilon_client ExecuteConsoleCmd
+---------------------------------------------------------------------
+
+Usage:
+    outputs = run_console_script(camera.avigilon_client,
+                                 ['logger', 'sll Vas.ValService DEBUG', 'exit'])
+
+Commands run in order, one ExecuteConsoleCmd request per command, and the
+script stops at the first command that raises or whose output reports an
+error (see CONSOLE_ERROR_PATTERN).
+
+batch=True is experimental: the whole script is sent as one newline separated
+console input. Multi-line console input has not been verified on camera
+firmware, so the combined reply is split back into per command outputs using
+the echoed commands, and when it cannot be split the script is run again one
+command per request. Only use it for scripts that are safe to repeat.
+"""
+import re
+
+VAL_DEBUG_SCRIPT = ['logger',
+                    'sll %s %s' % ("Vas.ValService", "DEBUG"),
+                    'exit',
+                    'vas',
+                    'evs %s' % ("10"),
+                    'exit']
+
+# console output that means the command was rejected
+CONSOLE_ERROR_PATTERN = re.compile(r'\b(error|unknown command|invalid|not found|failed)\b', re.IGNORECASE)
+
+
+class ConsoleCommandError(Exception):
+    """
+    Console command failed
+    command: failing command
+    outputs: outputs of the commands that completed before the failure
+    """
+    def __init__(self, command, outputs, error):
+        Exception.__init__(self, 'Console command "%s" failed: %s' % (command, error))
+        self.command = command
+        self.outputs = outputs
+        self.error = error
+
+
+def _output(response):
+    if isinstance(response, dict):
+        response = response.get('Output', '')
+    else:
+        response = getattr(response, 'Output', response)
+    return '' if response is None else str(response)
+
+
+def _check_output(command, output, outputs):
+    """
+    Raise ConsoleCommandError if the console output of a command reports an error
+    :param command: console command
+    :param output: console output of the command
+    :param outputs: outputs of the commands that completed before this one
+    """
+    match = CONSOLE_ERROR_PATTERN.search(output)
+    if match:
+        line = [l for l in output.splitlines() if match.group(0) in l][0]
+        raise ConsoleCommandError(command, outputs, line.strip())
+
+
+def _split_batch_output(commands, output):
+    """
+    Split the reply of a batched script into one output per command
+    :param commands: ordered list of console commands
+    :param output: combined console output
+    :return: list of outputs, or None if the commands are not all echoed in order
+    """
+    starts = []
+    position = 0
+    for command in commands:
+        index = output.find(command, position)
+        if index < 0:
+            return None
+        starts.append((index, index + len(command)))
+        position = index + len(command)
+    ends = [start for start, _ in starts[1:]] + [len(output)]
+    return [output[start[1]:end].strip() for start, end in zip(starts, ends)]
+
+
+def run_console_script(avigilon_client, commands, session=0, batch=False):
+    """
+    Run console commands in order, stop at the first failure
+    :param avigilon_client: camera.avigilon_client
+    :param commands: ordered list of console commands
+    :param session: console session argument of ExecuteConsoleCmd
+    :param batch: experimental, send all commands in one ExecuteConsoleCmd request
+    :return: list of command outputs, one per command
+    :raises ConsoleCommandError: if a command raises or its output reports an error
+    """
+    execute = avigilon_client.client.service.ExecuteConsoleCmd
+    if batch and commands:
+        script = '\n'.join(commands)
+        try:
+            split = _split_batch_output(commands, _output(execute(session, script)))
+        except Exception as e:
+            raise ConsoleCommandError(script, [], e)
+        if split is not None:
+            outputs = []
+            for command, output in zip(commands, split):
+                _check_output(command, output, outputs)
+                outputs.append(output)
+            return outputs
+
+    outputs = []
+    for command in commands:
+        try:
+            output = _output(execute(session, command))
+        except Exception as e:
+            raise ConsoleCommandError(command, outputs, e)
+        _check_output(command, output, outputs)
+        outputs.append(output)
+    return outputs
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Incremental reader for camera system logs
+-----------------------------------------
+
+camera.camera_log.get_system_logs() returns the whole system log. The reader
+keeps a cursor per camera so every poll yields only the lines added since the
+previous read, lazily, and searches stop at the first match.
+
+Usage:
+    reader = SystemLogReader.for_camera(ip, camera.camera_log)
+    exception = reader.find('VAL::EXCEPTION')
+
+If the line before the cursor changed (log rotation, a capped log dropping its
+oldest lines or a camera reboot) the reader looks for the last line it read in
+the new log and continues after it. Only if that line is gone it starts again
+from the beginning of the log.
+"""
+import threading
+from itertools import islice
+
+
+class SystemLogReader(object):
+    _readers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, camera_log):
+        """
+        :param camera_log: camera.camera_log object
+        """
+        self.camera_log = camera_log
+        self.cursor = 0
+        self.last_line = None
+
+    @classmethod
+    def for_camera(cls, key, camera_log):
+        """
+        Get the reader kept for a camera, so cursors survive new Camera objects
+        :param key: camera key, for example IP address
+        :param camera_log: current camera.camera_log object
+        :return: SystemLogReader
+        """
+        with cls._lock:
+            reader = cls._readers.get(key)
+            if reader is None:
+                reader = cls._readers[key] = cls(camera_log)
+            reader.camera_log = camera_log
+            return reader
+
+    def _resync(self, logs):
+        """
+        :return: index after the last line read in logs, 0 if it is not there any more
+        """
+        if not self.cursor or not hasattr(logs, '__len__'):
+            return self.cursor
+        if len(logs) >= self.cursor and logs[self.cursor - 1] == self.last_line:
+            return self.cursor
+        # lines only move towards the start when old ones are dropped, search backwards from the cursor
+        for i in range(min(self.cursor, len(logs)) - 1, -1, -1):
+            if logs[i] == self.last_line:
+                return i + 1
+        return 0
+
+    def new_lines(self):
+        """
+        Yield log lines added since the previous read and advance the cursor
+        """
+        logs = self.camera_log.get_system_logs()
+        self.cursor = self._resync(logs)
+        if not self.cursor:
+            self.last_line = None
+
+        if hasattr(logs, '__getitem__'):
+            lines = (logs[i] for i in range(self.cursor, len(logs)))
+        else:
+            lines = islice(logs, self.cursor, None)
+
+        for line in lines:
+            self.cursor += 1
+            self.last_line = line
+            yield line
+
+    def find(self, text):
+        """
+        Search new log lines for text, stop at the first match
+        :param text: text to look for, for example 'VAL::EXCEPTION'
+        :return: matching log line or None
+        """
+        for line in self.new_lines():
+            if line.find(text) != -1:
+                return line
+        return None
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+On-disk store of camera system logs collected during long runs
+--------------------------------------------------------------
+
+process_new_logs() reads only the lines added to the camera system log since
+the previous call (camera_log_reader.SystemLogReader cursor) and appends them
+to a LogSegmentStore directory. It only stores and queries lines, tests keep
+camera.process_camera_logs() as their log check:
+
+    seg-000001.log.gz   sealed segments, gzip compressed
+    seg-000002.log      active segment, plain text, searched through mmap
+    index.jsonl         lines matching INDEX_PATTERNS, with segment and line
+
+Lines matching an indexed pattern are answered from the index without
+touching the segments, other patterns scan the segments once:
+
+    python camera_log_store.py soak_logs/ 'VAL::EXCEPTION'
+"""
+import gzip
+import json
+import mmap
+import os
+import re
+import time
+import threading
+from camera_log_reader import SystemLogReader
+
+SEGMENT_LINES = 50000
+INDEX_PATTERNS = ('VAL::EXCEPTION', 'Segmentation fault', 'Kernel panic', 'Out of memory')
+VAL_EXCEPTION = 'VAL::EXCEPTION'
+SEGMENT_NAME = re.compile(r'^seg-(\d{6})\.log(\.gz)?$')
+
+
+class LogSegmentStore(object):
+    def __init__(self, directory, segment_lines=SEGMENT_LINES, index_patterns=INDEX_PATTERNS):
+        """
+        :param directory: store directory, created if missing
+        :param segment_lines: lines per segment before it is compressed
+        :param index_patterns: texts whose matching lines are indexed
+        """
+        self.directory = directory
+        self.segment_lines = segment_lines
+        self.index_patterns = tuple(index_patterns)
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        segments = self.segments()
+        self.segment = segments[-1][0] if segments else 1
+        if segments and segments[-1][1]:
+            self.segment += 1
+        self.lines = self._count_lines(self._path(self.segment))
+
+    def _path(self, segment, compressed=False):
+        return os.path.join(self.directory, 'seg-%06d.log%s' % (segment, '.gz' if compressed else ''))
+
+    @staticmethod
+    def _count_lines(path):
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            return sum(1 for _ in f)
+
+    def segments(self):
+        """
+        :return: sorted list of (segment number, compressed) in the store
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), bool(match.group(2))))
+        return sorted(found)
+
+    def append(self, lines, source=''):
+        """
+        Add new log lines, sealing the active segment when it is full
+        :param lines: log lines without line endings
+        :param source: name of the test that collected them, kept in the index
+        :return: list of index entries for the added lines
+        """
+        hits = []
+        with self.lock:
+            f = open(self._path(self.segment), 'ab')
+            try:
+                for line in lines:
+                    f.write((line if isinstance(line, bytes) else line.encode('utf-8')) + b'\n')
+                    for pattern in self.index_patterns:
+                        if line.find(pattern) != -1:
+                            hits.append({'pattern': pattern, 'segment': self.segment, 'line': self.lines,
+                                         'text': line, 'source': source, 'time': time.time()})
+                    self.lines += 1
+                    if self.lines >= self.segment_lines:
+                        f.close()
+                        self._seal(self.segment)
+                        self.segment += 1
+                        self.lines = 0
+                        f = open(self._path(self.segment), 'ab')
+            finally:
+                f.close()
+            if hits:
+                with open(os.path.join(self.directory, 'index.jsonl'), 'a') as index:
+                    for hit in hits:
+                        index.write(json.dumps(hit, sort_keys=True) + '\n')
+        return hits
+
+    def _seal(self, segment):
+        path = self._path(segment)
+        with open(path, 'rb') as src:
+            compressed = gzip.open(self._path(segment, compressed=True), 'wb')
+            try:
+                for chunk in iter(lambda: src.read(1 << 20), b''):
+                    compressed.write(chunk)
+            finally:
+                compressed.close()
+        os.remove(path)
+
+    def index(self, pattern=None):
+        """
+        :param pattern: one of index_patterns, None for all
+        :return: generator of index entries
+        """
+        path = os.path.join(self.directory, 'index.jsonl')
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if pattern is None or entry['pattern'] == pattern:
+                        yield entry
+
+    def query(self, text):
+        """
+        Find stored lines containing text, through the index when text is indexed
+        :return: generator of (segment, line text)
+        """
+        if text in self.index_patterns:
+            for entry in self.index(text):
+                yield entry['segment'], entry['text']
+            return
+        needle = text.encode('utf-8')
+        for segment, compressed in self.segments():
+            if compressed:
+                f = gzip.open(self._path(segment, compressed=True), 'rb')
+                try:
+                    for line in f:
+                        if line.find(needle) != -1:
+                            yield segment, line.rstrip(b'\n').decode('utf-8', 'replace')
+                finally:
+                    f.close()
+            else:
+                for line in self._search_active(segment, needle):
+                    yield segment, line
+
+    def _search_active(self, segment, needle):
+        path = self._path(segment)
+        if not os.path.getsize(path):
+            return
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                position = data.find(needle)
+                while position != -1:
+                    start = data.rfind(b'\n', 0, position) + 1
+                    end = data.find(b'\n', position)
+                    end = len(data) if end == -1 else end
+                    yield data[start:end].decode('utf-8', 'replace')
+                    position = data.find(needle, end)
+            finally:
+                data.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(directory):
+    """
+    LogSegmentStore of a directory, shared by all tests writing to it
+    """
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = LogSegmentStore(directory)
+        return store
+
+
+def process_new_logs(camera, test_name, directory):
+    """
+    Store camera system log lines added since the previous call and warn about indexed matches.
+    This is storage for later queries, camera.process_camera_logs() stays the pass/fail check.
+    :param directory: LogSegmentStore directory of this camera
+    :return: list of index entries of the new lines
+    """
+    # cameras may share a directory, each one keeps its own cursor
+    key = (directory, getattr(camera, 'ip', None) or id(camera))
+    reader = SystemLogReader.for_camera(key, camera.camera_log)
+    lines = list(reader.new_lines())
+    hits = store_for(directory).append(lines, test_name)
+    camera.logger.info('Stored %d new camera log lines for %s' % (len(lines), test_name))
+    for hit in hits:
+        camera.logger.warning('%s in camera log: %s' % (hit['pattern'], hit['text']))
+    return hits
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search camera logs stored by process_new_logs()")
+    parser.add_argument('directory', help="log store directory ('log_dir' argument of the test)")
+    parser.add_argument('text', nargs='?', default=VAL_EXCEPTION, help="text to search for")
+    args = parser.parse_args()
+
+    count = 0
+    for segment, line in LogSegmentStore(args.directory).query(args.text):
+        print('%06d: %s' % (segment, line))
+        count += 1
+    print('%d matching lines' % count)
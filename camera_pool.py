@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Pool of live Camera objects
+---------------------------
+
+Creating a Camera builds the avigilon, ptz, analytics, event and web service
+clients and parses their WSDLs, which takes seconds per camera. The pool keeps
+Camera objects keyed by IP and credentials so repeated sweeps reuse them.
+
+Usage:
+    camera = camera_pool.get_camera(user, password, ip)
+    ...
+    camera_pool.discard(user, password, ip)   # after a connection error
+
+suds keeps parsed WSDL and schema documents in its default on-disk cache for
+one day. Long running tools can opt in to a longer lived cache in
+WSDL_CACHE_DIR with enable_wsdl_cache() before creating cameras. suds reads
+the cache only while a Client is constructed and Camera builds its clients
+itself, so this changes the default cache of every suds client of the process.
+"""
+import os
+import tempfile
+import threading
+import time
+from CameraController.device.camera import Camera
+
+WSDL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'camera_wsdl_cache')
+WSDL_CACHE_DAYS = 30
+MAX_IDLE_SECONDS = 3600
+
+
+def enable_wsdl_cache(location=WSDL_CACHE_DIR, days=WSDL_CACHE_DAYS):
+    """
+    Make suds clients created from now on without an explicit cache use an ObjectCache
+    in location kept for days, call once at start-up
+    :return: the ObjectCache, None if suds is not importable
+    """
+    try:
+        from suds.cache import ObjectCache
+        from suds.client import Client
+    except ImportError:
+        return None
+    cache = getattr(Client.__init__, 'wsdl_cache', None)
+    if cache is not None:
+        return cache
+    cache = ObjectCache(location=location, days=days)
+    init = Client.__init__
+
+    def __init__(self, url, **kwargs):
+        # Camera builds its clients itself, give the ones without an explicit cache ours
+        kwargs.setdefault('cache', cache)
+        init(self, url, **kwargs)
+    __init__.wsdl_cache = cache
+    Client.__init__ = __init__
+    return cache
+
+
+class CameraPool(object):
+    def __init__(self, max_idle=MAX_IDLE_SECONDS, camera_factory=Camera):
+        """
+        :param max_idle: seconds after which an unused Camera is rebuilt
+        :param camera_factory: callable(user, password, ip) creating a Camera
+        """
+        self.max_idle = max_idle
+        self.camera_factory = camera_factory
+        self._cameras = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _prepare(self, camera):
+        if getattr(camera, 'event_client', True) is None:
+            camera.create_event_client()
+        if getattr(camera, 'avigilon_client', True) is None:
+            camera.create_avigilon_client()
+
+    def get(self, user, password, ip):
+        """
+        Get a live Camera, create it if not pooled or idle for too long
+        :return: Camera object
+        """
+        key = (ip, user, password)
+        with self._key_lock(key):
+            entry = self._cameras.get(key)
+            now = time.time()
+            if entry is not None and now - entry[1] <= self.max_idle:
+                self.hits += 1
+                camera = entry[0]
+            else:
+                self.misses += 1
+                camera = self.camera_factory(user, password, ip)
+                self._prepare(camera)
+            self._cameras[key] = (camera, now)
+            return camera
+
+    def discard(self, user, password, ip):
+        """
+        Drop a Camera from the pool, for example after a connection error
+        """
+        with self._lock:
+            self._cameras.pop((ip, user, password), None)
+
+    def clear(self):
+        with self._lock:
+            self._cameras.clear()
+
+
+default_pool = CameraPool()
+
+
+def get_camera(user, password, ip):
+    return default_pool.get(user, password, ip)
+
+
+def discard(user, password, ip):
+    default_pool.discard(user, password, ip)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+Record and replay of camera client calls
+----------------------------------------
+
+In record mode the analytics_client (with rule_service.ModifyRules),
+web_service_client, reboot() and set_factory_defaults() calls of a camera are
+passed through and stored with their results, faults and durations in a gzip
+JSON lines cassette. In replay mode the same calls are answered from the
+cassette without a camera, sleeping the recorded duration divided by speed
+(1 keeps the camera timing, 0 replays without delays).
+
+Tests use the camera arguments 'cassette', 'cassette_mode' ('record' or
+'replay') and 'cassette_speed', all tests of a camera share one cassette:
+
+    cassette = cassette_for(camera)      # None without 'cassette' argument
+    ...
+    if cassette is not None:
+        cassette.close()
+
+Calls are matched by client, method and arguments; calls with equal
+arguments are answered in recorded order. A call that was not recorded
+raises CassetteMiss. Calls a recorded call makes itself are not stored, the
+outer call replays them. Run as a script to replay the tamper tests of a
+cassette without hardware and compare replay time with recorded camera time,
+it exits non-zero when a test fails or recorded calls are left over:
+
+    python cassette.py tamper.cassette --speed 0
+    python cassette.py coalesced.cassette --tests coalesced
+"""
+import gzip
+import json
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from sim_camera import SudsObject, soap_fault
+
+NESTED_CLIENTS = ('rule_service',)
+CAMERA_CALLS = ('reboot', 'set_factory_defaults')
+RECORDED_PROPS = ('Model', 'FirmwareVersion', 'HardwareId')
+# --tests name: (module, test function) replayed by __main__
+REPLAY_TESTS = {'onvif': ('tamper_settings_onvif_test', 'test_tamper_settings'),
+                'web': ('tamper_settings_web_test', 'test_tamper_settings'),
+                'coalesced': ('tamper_settings_coalesced_test', 'test_tamper_settings_coalesced')}
+
+
+class CassetteMiss(Exception):
+    """
+    Replayed call that is not in the cassette
+    """
+
+
+class ReplayedError(Exception):
+    """
+    Replayed exception other than a SOAP fault
+    """
+
+
+def to_data(value):
+    """
+    JSON compatible form of a call argument or result, suds objects included
+    """
+    if isinstance(value, (list, tuple)):
+        return [to_data(item) for item in value]
+    if isinstance(value, dict):
+        return {'~dict': dict((str(key), to_data(item)) for key, item in value.items())}
+    if hasattr(value, '__keylist__'):
+        return {'~obj': dict((key, to_data(getattr(value, key))) for key in value.__keylist__)}
+    if isinstance(value, SudsObject):
+        return {'~obj': dict((key, to_data(item)) for key, item in value.__dict__.items())}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return u'%s' % value
+
+
+def from_data(data):
+    """
+    Rebuild a value stored by to_data(), suds objects become SudsObject
+    """
+    if isinstance(data, list):
+        return [from_data(item) for item in data]
+    if isinstance(data, dict):
+        if '~obj' in data:
+            return SudsObject(**dict((str(key), from_data(item)) for key, item in data['~obj'].items()))
+        return dict((key, from_data(item)) for key, item in data['~dict'].items())
+    return data
+
+
+class Cassette(object):
+    def __init__(self, path, mode='replay', speed=1.0):
+        """
+        :param path: cassette file
+        :param mode: 'record' or 'replay'
+        :param speed: replay speed factor, 0 replays without delays
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError("Cassette mode has to be 'record' or 'replay', got '%s'" % mode)
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.header = {}
+        self.entries = []
+        self.pending = defaultdict(deque)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls = 0
+        self.camera_time = 0.0
+        if mode == 'replay':
+            self._load()
+
+    def _load(self):
+        f = gzip.open(self.path, 'rb')
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line.decode('utf-8'))
+                if entry.get('type') == 'header':
+                    self.header = entry
+                else:
+                    self.pending[entry['key']].append(entry)
+        finally:
+            f.close()
+
+    @staticmethod
+    def key(client, method, args, kwargs):
+        return json.dumps([client, method, to_data(args), to_data(kwargs)], sort_keys=True)
+
+    def record(self, client, method, call):
+        """
+        :param call: callable to record
+        :return: callable passing arguments to call and storing the outcome
+        """
+        def recorded(*args, **kwargs):
+            # calls made inside another recorded call (set_factory_defaults resetting the analytics client)
+            # are replayed as part of it
+            if getattr(self.local, 'recording', False):
+                return call(*args, **kwargs)
+            entry = {'key': self.key(client, method, args, kwargs)}
+            start = time.time()
+            self.local.recording = True
+            try:
+                result = call(*args, **kwargs)
+                entry['result'] = to_data(result)
+                return result
+            except Exception as e:
+                fault = getattr(e, 'fault', None)
+                if fault is not None:
+                    entry['fault'] = u'%s' % getattr(fault, 'faultstring', fault)
+                else:
+                    entry['error'] = '%s: %s' % (type(e).__name__, e)
+                raise
+            finally:
+                self.local.recording = False
+                entry['duration'] = time.time() - start
+                with self.lock:
+                    self.entries.append(entry)
+                    self.calls += 1
+                    self.camera_time += entry['duration']
+        return recorded
+
+    def replay(self, client, method, args=(), kwargs=None):
+        key = self.key(client, method, args, kwargs or {})
+        with self.lock:
+            if not self.pending[key]:
+                raise CassetteMiss('No recorded %s.%s call with arguments %s' % (client, method, key))
+            entry = self.pending[key].popleft()
+            self.calls += 1
+            self.camera_time += entry['duration']
+        if self.speed:
+            time.sleep(entry['duration'] / self.speed)
+        if 'fault' in entry:
+            raise soap_fault(entry['fault'])
+        if 'error' in entry:
+            raise ReplayedError(entry['error'])
+        return from_data(entry['result'])
+
+    def remaining(self):
+        return sum(len(entries) for entries in self.pending.values())
+
+    def close(self):
+        """
+        Write the recorded calls, nothing to do in replay mode
+        """
+        if self.mode != 'record':
+            return
+        f = gzip.open(self.path, 'wb')
+        try:
+            for entry in [self.header] + self.entries:
+                f.write((json.dumps(entry, sort_keys=True) + '\n').encode('utf-8'))
+        finally:
+            f.close()
+
+
+class RecordingProxy(object):
+    def __init__(self, target, name, cassette):
+        self._target = target
+        self._name = name
+        self._cassette = cassette
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if attr in NESTED_CLIENTS:
+            return RecordingProxy(value, '%s.%s' % (self._name, attr), self._cassette)
+        if not callable(value):
+            return value
+        return self._cassette.record(self._name, attr, value)
+
+
+class ReplayProxy(object):
+    def __init__(self, name, cassette):
+        self._name = name
+        self._cassette = cassette
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if attr in NESTED_CLIENTS:
+            return ReplayProxy('%s.%s' % (self._name, attr), self._cassette)
+
+        def replayed(*args, **kwargs):
+            return self._cassette.replay(self._name, attr, args, kwargs)
+        return replayed
+
+
+def use_cassette(camera, path, mode='replay', speed=1.0):
+    """
+    Route the tamper test clients of camera through a cassette
+    :return: Cassette, close() it at the end of the test
+    """
+    cassette = Cassette(path, mode, speed)
+    for client in ('analytics_client', 'web_service_client'):
+        if mode == 'record':
+            setattr(camera, client, RecordingProxy(getattr(camera, client), client, cassette))
+        else:
+            setattr(camera, client, ReplayProxy(client, cassette))
+    for method in CAMERA_CALLS:
+        if mode == 'record':
+            setattr(camera, method, cassette.record('camera', method, getattr(camera, method)))
+        else:
+            setattr(camera, method, ReplayProxy('camera', cassette).__getattr__(method))
+    if mode == 'record':
+        # test arguments decide which calls the test makes, replay runs with the same ones
+        arguments = dict((name, value) for name, value in camera.arguments.items()
+                         if not name.startswith('cassette') and isinstance(value, (bool, int, float, str)))
+        cassette.header = {'type': 'header', 'time': time.time(), 'arguments': arguments,
+                           'props': dict((name, camera.cp.props.get(name)) for name in RECORDED_PROPS)}
+    return cassette
+
+
+_cassettes = weakref.WeakKeyDictionary()
+
+
+def cassette_for(camera):
+    """
+    Cassette configured by camera arguments 'cassette', 'cassette_mode' and 'cassette_speed',
+    set up on first use
+    :return: Cassette or None if the test runs without one
+    """
+    if not camera.arguments.get('cassette'):
+        return None
+    cassette = _cassettes.get(camera)
+    if cassette is None:
+        cassette = _cassettes[camera] = use_cassette(camera, camera.arguments['cassette'],
+                                                     camera.arguments.get('cassette_mode', 'replay'),
+                                                     camera.arguments.get('cassette_speed', 1.0))
+    return cassette
+
+
+if __name__ == '__main__':
+    import argparse
+    import logging
+    import sys
+    from sim_camera import SimulatedCamera
+
+    parser = argparse.ArgumentParser(description="Replay tamper settings tests from a cassette")
+    parser.add_argument('cassette', help="cassette recorded with cassette_mode 'record'")
+    parser.add_argument('--speed', type=float, default=0, help="replay speed factor, 0 for no delays")
+    parser.add_argument('--tests', nargs='+', choices=sorted(REPLAY_TESTS), default=['onvif', 'web'],
+                        help="tamper test modules recorded in the cassette")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    header = Cassette(args.cassette).header
+    arguments = dict(header.get('arguments', {}), cassette=args.cassette, cassette_mode='replay',
+                     cassette_speed=args.speed)
+    camera = SimulatedCamera(reboot_time=0, arguments=arguments)
+    camera.cp.props.update(header.get('props', {}))
+    start = time.time()
+    for name in args.tests:
+        module_name, test_name = REPLAY_TESTS[name]
+        getattr(__import__(module_name), test_name)(camera)
+    elapsed = time.time() - start
+    # the tests registered the cassette in the imported module, not in __main__
+    cassette = __import__('cassette').cassette_for(camera)
+    print('Replayed %d calls in %.2f s, recorded camera time %.2f s, %d recorded calls not replayed'
+          % (cassette.calls, elapsed, cassette.camera_time, cassette.remaining()))
+    # calls left over mean the replayed tests did not match the recording
+    sys.exit(0 if camera.logger.get_fail_count() == 0 and cassette.remaining() == 0 else 1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Camera inventory reading, sharding and shard output merging
+-----------------------------------------------------------
+
+Inventory files have one 'IP,User,Passwd' line per camera. read_inventory()
+streams the file, skips blank lines, comments and duplicate IPs, and reports
+malformed lines instead of failing on them.
+
+Cameras are assigned to shards by a stable hash of the IP, so every host or
+process given the same inventory and '--shard i/N' gets the same cameras:
+
+    GetCameraStatus.py cameras.txt --shard 0/3 --output ndjson > shard0.ndjson
+    GetCameraStatus.py cameras.txt --shard 1/3 --output ndjson > shard1.ndjson
+    GetCameraStatus.py cameras.txt --shard 2/3 --output ndjson > shard2.ndjson
+    GetCameraStatus.py --merge shard0.ndjson shard1.ndjson shard2.ndjson
+"""
+import json
+import logging
+import zlib
+
+
+def parse_shard(text):
+    """
+    :param text: shard spec 'i/N', for example '0/4'
+    :return: (i, N) tuple
+    :raises ValueError: if spec is malformed or i is not in range 0..N-1
+    """
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise ValueError("Shard has to be defined as i/N, got '%s'" % text)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError("Shard index has to be in range 0..%d, got '%s'" % (count - 1, text))
+    return index, count
+
+
+def shard_of(ip, count):
+    """
+    Stable shard number of a camera, same on every host and Python version
+    """
+    return (zlib.crc32(ip.encode('utf-8')) & 0xffffffff) % count
+
+
+def read_inventory(path, shard=0, shards=1):
+    """
+    Stream cameras of one shard from an inventory file
+    :param path: inventory file, one 'IP,User,Passwd' per line
+    :param shard: shard index
+    :param shards: number of shards
+    :return: generator of [IP, User, Passwd] lists
+    """
+    seen = set()
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            credentials = [field.strip() for field in line.split(',')]
+            if len(credentials) != 3 or not all(credentials):
+                logging.warning("%s:%d: malformed inventory line, expected IP,User,Passwd: %s", path, number, line)
+                continue
+            if credentials[0] in seen:
+                logging.warning("%s:%d: duplicate camera %s skipped", path, number, credentials[0])
+                continue
+            seen.add(credentials[0])
+            if shards > 1 and shard_of(credentials[0], shards) != shard:
+                continue
+            yield credentials
+
+
+def merge_ndjson(paths, headers):
+    """
+    Combine NDJSON shard outputs into rows sorted by IP
+    :param paths: NDJSON files written with '--output ndjson'
+    :param headers: column names of the rows
+    :return: list of rows
+    """
+    rows = []
+    for path in paths:
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("%s:%d: not a JSON row, skipped", path, number)
+                    continue
+                rows.append([record.get(name, '') for name in headers])
+    rows.sort(key=lambda row: row[0])
+    return rows
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Parser for avigilon_client.gss() output
+---------------------------------------
+
+gss output looks like:
+
+    Rel 3d4h5m6s
+    ...
+    SysCpu 10.0, 12.0, 11.5, ProcCpu 30.5, SysMem 45.2%
+    ...
+     12 : -- ValService 1.5% Prio 50 ...
+
+Field order and separators differ between firmware versions, so every field is
+looked up by name with precompiled patterns instead of by position. Missing
+fields are returned as None. VARIANT_SAMPLES holds the layouts the parser has
+to accept, all with the values of SAMPLE_GSS.
+
+Run as a script to check the layouts and benchmark the parser over captured gss
+outputs:
+
+    python gss_parser.py [-n 100000] capture1.txt capture2.txt ...
+"""
+import re
+import sys
+import time
+from collections import namedtuple
+
+# uptime: seconds since boot, sys_cpu: tuple of floats, proc_cpu and sys_mem: floats,
+# val_service: ValService load as printed by the camera,
+# sys_cpu_text, proc_cpu_text, sys_mem_text: load as printed by the camera, for example '10.0,12.0', '30.5', '45.2%'
+GssStatus = namedtuple('GssStatus', 'uptime sys_cpu proc_cpu sys_mem val_service '
+                                    'sys_cpu_text proc_cpu_text sys_mem_text')
+
+_UPTIME_RE = re.compile(r'(?:Rel\s+)?(?:(\d+)\s*d)?\s*(?:(\d+)\s*h)?\s*(?:(\d+)\s*m)?\s*(?:(\d+)\s*s)?\s*$')
+_SYS_CPU_RE = re.compile(r'SysCpu\s*:?\s*((?:[\d.]+%?\s*,?\s*)+)')
+_PROC_CPU_RE = re.compile(r'ProcCpu\s*:?\s*([\d.]+)')
+_SYS_MEM_RE = re.compile(r'SysMem\s*:?\s*([\d.]+%?)')
+_NUMBER_RE = re.compile(r'[\d.]+')
+_VAL_SERVICE_RE = re.compile(r'ValService\s*(.*?)(?:\s+Prio\s.*)?$')
+
+SAMPLE_GSS = ("Rel 3d4h5m6s\n"
+              "Tasks 112\n"
+              "SysCpu 10.0, 12.0, 11.5, ProcCpu 30.5, SysMem 45.2%\n"
+              " Id : Name Load Prio\n"
+              " 11 : -- Rtsp 0.4% Prio 40 Stack 8192\n"
+              " 12 : -- ValService 1.5% Prio 50 Stack 16384\n")
+
+# other firmware layouts of SAMPLE_GSS: colons, one field per line, other field order,
+# uptime with spaces and without 'Rel', no Prio column
+VARIANT_SAMPLES = [
+    SAMPLE_GSS,
+    ("Rel 3d 4h 5m 6s\n"
+     "Tasks: 112\n"
+     "SysCpu: 10.0, 12.0, 11.5\n"
+     "ProcCpu: 30.5\n"
+     "SysMem: 45.2%\n"
+     " 12 : -- ValService 1.5% Prio 50\n"),
+    ("3d4h5m6s\n"
+     "SysMem 45.2%, ProcCpu 30.5, SysCpu 10.0, 12.0, 11.5\n"
+     " 11 : -- Rtsp 0.4% Prio 40 Stack 8192\n"
+     " 12 : -- ValService 1.5%\n"),
+]
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_uptime(line):
+    """
+    Convert gss uptime line to seconds
+    :param line: for example 'Rel 3d4h5m6s'
+    :return: uptime in seconds or None if line is not an uptime line
+    """
+    match = _UPTIME_RE.match(line.strip())
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = [int(g) if g else 0 for g in match.groups()]
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def format_uptime(seconds):
+    """
+    Print uptime in human syntax
+    :param seconds: uptime in seconds
+    :return: for example '3 days 4 hours 5 minutes 6 seconds'
+    """
+    if seconds is None:
+        return ''
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return '%d days %d hours %d minutes %d seconds' % (days, hours, minutes, seconds)
+
+
+def parse_gss(text):
+    """
+    Parse gss output
+    :param text: gss output text (gss()['Output'])
+    :return: GssStatus record, fields not found in text are None
+    """
+    uptime = sys_cpu = proc_cpu = sys_mem = val_service = None
+    sys_cpu_text = proc_cpu_text = sys_mem_text = None
+
+    for line in text.splitlines():
+        if uptime is None:
+            uptime = parse_uptime(line)
+            if uptime is not None:
+                continue
+        if sys_cpu is None and 'SysCpu' in line:
+            match = _SYS_CPU_RE.search(line)
+            if match:
+                numbers = _NUMBER_RE.findall(match.group(1))
+                sys_cpu = tuple(n for n in map(_to_float, numbers) if n is not None)
+                sys_cpu_text = ','.join(numbers[:2])
+        if proc_cpu is None and 'ProcCpu' in line:
+            match = _PROC_CPU_RE.search(line)
+            if match:
+                proc_cpu_text = match.group(1)
+                proc_cpu = _to_float(proc_cpu_text)
+        if sys_mem is None and 'SysMem' in line:
+            match = _SYS_MEM_RE.search(line)
+            if match:
+                sys_mem_text = match.group(1)
+                sys_mem = _to_float(sys_mem_text.rstrip('%'))
+        if val_service is None and 'ValService' in line:
+            match = _VAL_SERVICE_RE.search(line.strip())
+            if match:
+                val_service = match.group(1).strip()
+                if None not in (uptime, sys_cpu, proc_cpu, sys_mem):
+                    break
+
+    return GssStatus(uptime, sys_cpu, proc_cpu, sys_mem, val_service, sys_cpu_text, proc_cpu_text, sys_mem_text)
+
+
+def check_variants(samples=VARIANT_SAMPLES):
+    """
+    Parse every layout and compare with the first one
+    :param samples: gss output texts of the same camera state
+    :return: list of mismatch messages, empty if all layouts parse to the same fields
+    """
+    expected = parse_gss(samples[0])
+    messages = []
+    for i, text in enumerate(samples):
+        status = parse_gss(text)
+        for field in GssStatus._fields:
+            if getattr(status, field) is None or getattr(status, field) != getattr(expected, field):
+                messages.append('variant %d: %s is %r, expected %r'
+                                % (i, field, getattr(status, field), getattr(expected, field)))
+    return messages
+
+
+def benchmark(corpus, count=100000):
+    """
+    Parse count snapshots taken round robin from corpus
+    :param corpus: list of gss output texts
+    :param count: number of snapshots to parse
+    :return: elapsed seconds
+    """
+    size = len(corpus)
+    start = time.time()
+    for i in range(count):
+        parse_gss(corpus[i % size])
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark gss parser over captured gss outputs")
+    parser.add_argument('captures', nargs='*', help="files with one captured gss output each")
+    parser.add_argument('-n', '--count', type=int, default=100000, help="number of snapshots to parse")
+    args = parser.parse_args()
+
+    mismatches = check_variants()
+    for message in mismatches:
+        sys.stderr.write("Variant mismatch: %s\n" % message)
+    if mismatches:
+        sys.exit(1)
+
+    corpus = []
+    for path in args.captures:
+        with open(path) as f:
+            corpus.append(f.read())
+    if not corpus:
+        corpus = [SAMPLE_GSS]
+
+    for text in corpus:
+        status = parse_gss(text)
+        if status.uptime is None or status.sys_cpu is None:
+            sys.stderr.write("Warning: incomplete parse %s\n" % (status,))
+
+    elapsed = benchmark(corpus, args.count)
+    print("Parsed %d snapshots from %d captures in %.3f s (%.1f us/snapshot)"
+          % (args.count, len(corpus), elapsed, elapsed / args.count * 1e6))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Mergeable latency histograms of reboot iteration phases
+-------------------------------------------------------
+
+LatencyHistogram counts durations in log-linear buckets, the layout used by
+HdrHistogram: values are kept with SIGNIFICANT_BITS bits of precision (better
+than 1% relative error) from RESOLUTION seconds up to any duration, in a
+sparse dict of bucket counts. Memory does not grow with the number of
+iterations, and histograms of different cameras, processes or runs are merged
+by adding bucket counts, so percentiles of the merged histogram are exact to
+bucket precision.
+
+PhaseHistograms keeps one histogram per iteration phase:
+
+    phases = histograms_for(camera)      # one set per camera object
+    phases.add({'reboot': 1.2, 'stream': 35.0})
+    phases.table()                       # p50, p95, p99 per phase
+
+Run as a script to merge latency files saved by repeated_reboot_test
+('latency_file' argument) and report them per firmware:
+
+    python latency_histogram.py cam1.json cam2.json [--baseline old_fw.json]
+"""
+import json
+import weakref
+
+RESOLUTION = 0.001
+SIGNIFICANT_BITS = 8
+PERCENTILES = (50, 95, 99)
+# phases of a repeated reboot iteration, in order
+PHASES = ('move', 'set_home', 'reboot', 'stream', 'ptz', 'val', 'logs')
+REGRESSION_MARGIN = 0.2
+
+
+class LatencyHistogram(object):
+    def __init__(self, resolution=RESOLUTION, significant_bits=SIGNIFICANT_BITS):
+        """
+        :param resolution: smallest distinguished duration in seconds
+        :param significant_bits: bits of precision kept per value
+        """
+        self.resolution = resolution
+        self.significant_bits = significant_bits
+        self.half = 1 << (significant_bits - 1)
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, units):
+        shift = max(0, units.bit_length() - self.significant_bits)
+        return shift * self.half + (units >> shift)
+
+    def _value(self, index):
+        """
+        :return: middle of the bucket in seconds
+        """
+        shift = max(0, index // self.half - 1)
+        low = (index - shift * self.half) << shift
+        return (low + ((1 << shift) - 1) / 2.0) * self.resolution
+
+    def record(self, seconds, count=1):
+        index = self._index(max(0, int(round(seconds / self.resolution))))
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += seconds * count
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other):
+        """
+        Add counts of another histogram with the same resolution and precision
+        """
+        if (other.resolution, other.significant_bits) != (self.resolution, self.significant_bits):
+            raise ValueError("Cannot merge histograms with different resolution or precision")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, p):
+        """
+        :param p: percentile 0..100
+        :return: duration in seconds, None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {'resolution': self.resolution, 'significant_bits': self.significant_bits,
+                'counts': dict((str(index), count) for index, count in self.counts.items()),
+                'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['resolution'], data['significant_bits'])
+        histogram.counts = dict((int(index), count) for index, count in data['counts'].items())
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class PhaseHistograms(object):
+    """
+    One LatencyHistogram per phase name
+    """
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, durations):
+        """
+        :param durations: dict phase name -> seconds
+        """
+        for phase, seconds in durations.items():
+            if seconds is not None:
+                self.histogram(phase).record(seconds)
+
+    def histogram(self, phase):
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = LatencyHistogram()
+        return histogram
+
+    def merge(self, other):
+        for phase, histogram in other.phases.items():
+            self.histogram(phase).merge(histogram)
+        return self
+
+    def ordered(self):
+        known = [phase for phase in PHASES if phase in self.phases]
+        return known + sorted(phase for phase in self.phases if phase not in PHASES)
+
+    def table(self):
+        """
+        :return: rows of phase, count, p50, p95, p99, max in seconds
+        """
+        return [[phase, self.phases[phase].count] + [self.phases[phase].percentile(p) for p in PERCENTILES] +
+                [self.phases[phase].max] for phase in self.ordered()]
+
+    def format(self):
+        lines = ['phase         count      p50      p95      p99      max']
+        for row in self.table():
+            lines.append('%-10s %8d %8.3f %8.3f %8.3f %8.3f' % tuple(row))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return dict((phase, histogram.to_dict()) for phase, histogram in self.phases.items())
+
+    @classmethod
+    def from_dict(cls, data):
+        histograms = cls()
+        for phase, histogram in data.items():
+            histograms.phases[phase] = LatencyHistogram.from_dict(histogram)
+        return histograms
+
+
+def phase_durations(marks, timings=None):
+    """
+    :param marks: list of (phase name, end time) in order, the first entry is ('start', start time)
+    :param timings: optional wait_for_camera_ready() timings, seconds since the probe started,
+                    split into stream, ptz and val phases after 'reboot'
+    :return: dict phase name -> seconds
+    """
+    durations = {}
+    for (_, previous), (phase, end) in zip(marks, marks[1:]):
+        durations[phase] = end - previous
+    previous = 0.0
+    for phase in ('stream', 'ptz', 'val'):
+        if timings and phase in timings:
+            durations[phase] = timings[phase] - previous
+            previous = timings[phase]
+    return durations
+
+
+def compare(current, baseline, margin=REGRESSION_MARGIN):
+    """
+    :param current: PhaseHistograms of the run
+    :param baseline: PhaseHistograms of a known good run
+    :param margin: allowed relative p95 increase over baseline
+    :return: list of regression messages, empty if none
+    """
+    messages = []
+    for phase in current.ordered():
+        if phase not in baseline.phases or not baseline.phases[phase].count:
+            continue
+        p95, base_p95 = current.phases[phase].percentile(95), baseline.phases[phase].percentile(95)
+        if p95 > base_p95 * (1 + margin) and p95 - base_p95 > RESOLUTION:
+            messages.append('%s p95 %.3f s regressed from baseline %.3f s' % (phase, p95, base_p95))
+    return messages
+
+
+def save(path, histograms, **info):
+    """
+    Write histograms to a JSON file, info is stored with them (for example ip and firmware)
+    """
+    with open(path, 'w') as f:
+        json.dump(dict(info, phases=histograms.to_dict()), f, sort_keys=True)
+
+
+def load(path):
+    """
+    :return: (info dict, PhaseHistograms)
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return data, PhaseHistograms.from_dict(data.pop('phases'))
+
+
+_histograms = weakref.WeakKeyDictionary()
+
+
+def histograms_for(camera):
+    """
+    Phase histograms of a camera object, created on first use
+    """
+    histograms = _histograms.get(camera)
+    if histograms is None:
+        histograms = _histograms[camera] = PhaseHistograms()
+    return histograms
+
+
+def by_firmware(items):
+    """
+    :param items: iterable of (info dict, PhaseHistograms), info has 'firmware' or 'FirmwareVersion'
+    :return: dict firmware -> merged PhaseHistograms
+    """
+    merged = {}
+    for info, histograms in items:
+        firmware = info.get('firmware') or info.get('FirmwareVersion') or 'unknown'
+        merged.setdefault(firmware, PhaseHistograms()).merge(histograms)
+    return merged
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Merge reboot phase latency histograms per firmware")
+    parser.add_argument('latency_files', nargs='+', help="files saved by repeated_reboot_test 'latency_file'")
+    parser.add_argument('--baseline', nargs='+', help="latency files of a known good firmware build")
+    parser.add_argument('--margin', type=float, default=REGRESSION_MARGIN, help="allowed relative p95 increase")
+    args = parser.parse_args()
+
+    merged = by_firmware(load(path) for path in args.latency_files)
+    baseline = None
+    if args.baseline:
+        baseline = PhaseHistograms()
+        for path in args.baseline:
+            baseline.merge(load(path)[1])
+    regressions = []
+    for firmware in sorted(merged):
+        print('Firmware %s' % firmware)
+        print(merged[firmware].format())
+        if baseline is not None:
+            for message in compare(merged[firmware], baseline, args.margin):
+                regressions.append('%s: %s' % (firmware, message))
+    for message in regressions:
+        print('REGRESSION: %s' % message)
+    sys.exit(1 if regressions else 0)
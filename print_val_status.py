@@ -1,11 +1,42 @@
 #!/usr/bin/env python
 """
 Print PTZ coordinates and VAL status
+
+    print_val_status.py                    watch the default camera
+    print_val_status.py cameras.txt        status board of all PTZ cameras in IP,User,Passwd file
+
+Changes are reported with timestamps as they happen. The camera event service
+(ONVIF PullPoint subscription) is used to learn when PTZ or analytics state
+changes; if the camera does not support it, the status is polled with an
+interval that shortens while things change and grows while they do not.
 """
+import sys
 import time
+import socket
+import argparse
+import threading
+from datetime import datetime
 from random import random
+from tabulate import tabulate
 from CameraController.device.camera import Camera
 from CameraController.utils.utils import isclose
+import camera_pool
+from fleet_inventory import read_inventory
+from sample_ring import ring_for, record_position, record_val_status, val_state_code
+
+SUBSCRIPTION_TIME = 'PT60S'
+PULL_TIMEOUT = 'PT10S'
+PULL_MESSAGE_LIMIT = 32
+# event topics that may change PTZ position or VAL status
+TRIGGER_TOPICS = ('PTZ', 'VideoAnalytics', 'RuleEngine', 'Vas', 'Val')
+MIN_POLL_TIME = 0.5
+MAX_POLL_TIME = 10
+# seconds after which a status board poll is abandoned
+POLL_TIMEOUT = 30
+# samples kept per camera on the status board
+BOARD_RING_CAPACITY = 3600
+BOARD_HEADERS = ['IP', 'Pan', 'Tilt', 'Zoom', 'VAL status', 'Last poll', 'Latency (ms)', 'Avg (ms)', 'Max (ms)',
+                 'Errors']
 
 
 def get_ptz_position(camera):
@@ -14,6 +45,7 @@ def get_ptz_position(camera):
     """
     pos = camera.ptz_client.get_status().Position
     camera.logger.info("Current Pan: %f, Tilt: %f, Zoom: %f" % (pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x))
+    record_position(camera, pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x)
     return pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x
 
 
@@ -23,12 +55,233 @@ def get_val_status(camera):
     """
     val_status = camera.avigilon_client.get_val_status()
     camera.logger.info('VAL status is %s' % val_status)
+    record_val_status(camera, val_status)
     return val_status
 
 
-if __name__ == '__main__':
-    camera = Camera()
+def read_state(camera, **ring_options):
+    """
+    read ptz position and val status without logging, keep them in camera sample ring
+    :param ring_options: SampleRing options used if the camera has no ring yet
+    :return: (pan, tilt, zoom, val_status)
+    """
+    pos = camera.ptz_client.get_status().Position
+    val_status = camera.avigilon_client.get_val_status()
+    ring_for(camera, **ring_options).append(time.time(), pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x, val_state_code(val_status))
+    return pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x, val_status
+
+
+def report_change(camera, last_state):
+    """
+    read current state and log it with timestamp if it differs from last_state
+    :return: (current state, True if state changed)
+    """
+    state = read_state(camera)
+    if last_state is not None and all(isclose(a, b) for a, b in zip(state[:3], last_state[:3])) \
+            and state[3] == last_state[3]:
+        return state, False
+    camera.logger.info("%s Pan: %f, Tilt: %f, Zoom: %f, VAL status: %s"
+                       % ((datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),) + state))
+    return state, True
+
+
+def create_pull_point(camera):
+    """
+    create ONVIF PullPoint subscription on camera event service
+    :return: suds client bound to the subscription address
+    """
+    if camera.event_client is None:
+        camera.create_event_client()
+    client = camera.event_client.client
+    response = client.service.CreatePullPointSubscription(InitialTerminationTime=SUBSCRIPTION_TIME)
+    pull_client = client.clone()
+    pull_client.set_options(location=response.SubscriptionReference.Address.value)
+    return pull_client
+
+
+def pull_triggers(pull_client):
+    """
+    wait up to PULL_TIMEOUT for events, renew subscription
+    :return: True if any event topic may have changed PTZ or VAL state
+    """
+    response = pull_client.service.PullMessages(Timeout=PULL_TIMEOUT, MessageLimit=PULL_MESSAGE_LIMIT)
+    pull_client.service.Renew(TerminationTime=SUBSCRIPTION_TIME)
+    messages = getattr(response, 'NotificationMessage', None) or []
+    for message in messages:
+        topic = str(getattr(message, 'Topic', ''))
+        if any(trigger in topic for trigger in TRIGGER_TOPICS):
+            return True
+    return False
+
+
+def watch_val_status(camera, use_events=True, min_poll_time=MIN_POLL_TIME, max_poll_time=MAX_POLL_TIME):
+    """
+    log ptz position and val status whenever they change
+    :param use_events: try ONVIF PullPoint subscription before falling back to polling
+    :param min_poll_time: polling interval while state changes
+    :param max_poll_time: longest polling interval while state is stable
+    """
+    state, _ = report_change(camera, None)
+
+    pull_client = None
+    if use_events:
+        try:
+            pull_client = create_pull_point(camera)
+            camera.logger.info("Subscribed to camera events")
+        except Exception as e:
+            camera.logger.warning("Event subscription not available (%s), using adaptive polling" % e)
+
+    poll_time = min_poll_time
+    last_read = time.time()
     while True:
-        get_ptz_position(camera)
-        get_val_status(camera)
-        time.sleep(2)
+        if pull_client is not None:
+            try:
+                # also re-read every max_poll_time in case a change raised no event
+                if pull_triggers(pull_client) or time.time() - last_read >= max_poll_time:
+                    state, _ = report_change(camera, state)
+                    last_read = time.time()
+            except Exception as e:
+                camera.logger.warning("Event subscription lost (%s), using adaptive polling" % e)
+                pull_client = None
+            continue
+
+        state, changed = report_change(camera, state)
+        poll_time = min_poll_time if changed else min(poll_time * 2, max_poll_time)
+        time.sleep(poll_time)
+
+
+class StatusBoard(object):
+    """
+    Latest PTZ position, VAL status and poll latency of many cameras.
+    Every poll runs in its own thread, at most 'workers' at a time. A camera is
+    polled again 'interval' seconds after its previous poll started and never
+    while it is still being polled. A poll longer than poll_timeout is counted
+    as an error and abandoned, its thread keeps its worker slot until it exits.
+    """
+    def __init__(self, inventory, workers=8, interval=2, poll_timeout=POLL_TIMEOUT):
+        """
+        :param inventory: list of [IP, User, Passwd] lists
+        :param workers: number of cameras polled at the same time
+        :param interval: seconds between polls of one camera
+        :param poll_timeout: seconds after which a poll is abandoned
+        """
+        self.inventory = dict((credentials[0], credentials) for credentials in inventory)
+        self.workers = workers
+        self.interval = interval
+        self.poll_timeout = poll_timeout
+        self.lock = threading.Lock()
+        # ip -> (thread, start time) of running polls, ip -> thread of abandoned ones
+        self.running = {}
+        self.abandoned = {}
+        self.next_due = dict((ip, 0) for ip in self.inventory)
+        self.rows = dict((ip, {'state': None, 'polled': None, 'latency': None, 'avg': None, 'max': None,
+                               'polls': 0, 'errors': 0}) for ip in self.inventory)
+
+    def poll(self, ip):
+        user, password = self.inventory[ip][1:3]
+        start = time.time()
+        try:
+            state = read_state(camera_pool.get_camera(user, password, ip), capacity=BOARD_RING_CAPACITY)
+            error = None
+        except Exception as e:
+            camera_pool.discard(user, password, ip)
+            state, error = None, e
+        latency = time.time() - start
+
+        with self.lock:
+            if self.running.pop(ip, None) is None:
+                # abandoned poll, already counted as an error
+                self.abandoned.pop(ip, None)
+                return
+            row = self.rows[ip]
+            row['polled'] = start
+            row['latency'] = latency
+            if error is None:
+                row['state'] = state
+                row['polls'] += 1
+                row['avg'] = latency if row['avg'] is None else row['avg'] + (latency - row['avg']) / row['polls']
+                row['max'] = max(latency, row['max'] or 0)
+            else:
+                row['errors'] += 1
+
+    def abandon_late_polls(self, now):
+        for ip, (t, start) in list(self.running.items()):
+            if now - start > self.poll_timeout:
+                del self.running[ip]
+                self.abandoned[ip] = t
+                row = self.rows[ip]
+                row['polled'] = start
+                row['latency'] = now - start
+                row['errors'] += 1
+                user, password = self.inventory[ip][1:3]
+                camera_pool.discard(user, password, ip)
+        for ip, t in list(self.abandoned.items()):
+            if not t.is_alive():
+                del self.abandoned[ip]
+
+    def schedule(self):
+        now = time.time()
+        with self.lock:
+            self.abandon_late_polls(now)
+            for ip, due in sorted(self.next_due.items(), key=lambda item: item[1]):
+                if len(self.running) + len(self.abandoned) >= self.workers:
+                    break
+                if due <= now and ip not in self.running and ip not in self.abandoned:
+                    self.next_due[ip] = now + self.interval
+                    t = threading.Thread(target=self.poll, args=(ip,))
+                    t.daemon = True
+                    self.running[ip] = (t, now)
+                    t.start()
+
+    def table(self):
+        def ms(seconds):
+            return '' if seconds is None else '%.0f' % (seconds * 1000)
+
+        table = []
+        with self.lock:
+            for ip in sorted(self.rows):
+                row = self.rows[ip]
+                state = row['state'] or ('', '', '', '')
+                polled = datetime.fromtimestamp(row['polled']).strftime('%H:%M:%S') if row['polled'] else ''
+                table.append([ip] + list(state) + [polled, ms(row['latency']), ms(row['avg']), ms(row['max']),
+                                                   row['errors']])
+        return tabulate(table, BOARD_HEADERS, tablefmt='grid', floatfmt='.4f')
+
+    def run(self, refresh=2, out=sys.stdout):
+        """
+        poll cameras forever and redraw the board every 'refresh' seconds
+        """
+        last_draw = 0
+        while True:
+            self.schedule()
+            if time.time() - last_draw >= refresh:
+                last_draw = time.time()
+                if out.isatty():
+                    out.write('\x1b[H\x1b[2J')
+                out.write('%s\n%s\n' % (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.table()))
+                out.flush()
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print PTZ coordinates and VAL status")
+    parser.add_argument('camFile', nargs='?', help="IP,User,Passwd file, shows a status board of all cameras")
+    parser.add_argument('--workers', type=int, default=8, help="number of cameras polled at the same time")
+    parser.add_argument('--interval', type=float, default=2, help="seconds between polls of one camera")
+    parser.add_argument('--poll-timeout', type=float, default=POLL_TIMEOUT,
+                        help="seconds after which a status board poll is abandoned")
+    parser.add_argument('--samples', help="binary file the default camera samples are appended to")
+    args = parser.parse_args()
+
+    if args.camFile:
+        # abandoned polls of hung cameras end when their socket times out
+        socket.setdefaulttimeout(args.poll_timeout)
+        StatusBoard(list(read_inventory(args.camFile)), max(args.workers, 1), args.interval,
+                    args.poll_timeout).run()
+    else:
+        camera = Camera()
+        ring = ring_for(camera, path=args.samples)
+        try:
+            watch_val_status(camera)
+        finally:
+            ring.flush()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+PTZ home position drift analysis across reboots
+-----------------------------------------------
+
+DriftRecorder keeps the home position set before each reboot (target) and the
+position read after the reboot (actual) of the last 'window' iterations in a
+NumPy ring buffer, so memory does not grow with the run. drift_stats()
+computes per axis error statistics over these iterations at once, with pan
+errors wrapped around the pan range so moving across the seam is not counted
+as a full turn.
+
+save() appends the iterations added since the previous save to a binary file
+of RECORD records, so saving costs the same at iteration 100 and 100000.
+Run as a script to analyse all iterations of a saved run:
+
+    python ptz_drift.py drift.bin [--tolerance 0.005] [--baseline old_drift.bin]
+"""
+import os
+import numpy as np
+
+AXES = ('pan', 'tilt', 'zoom')
+# ONVIF generic pan space is -1..1 and wraps around, a pan error is at most one
+# period / 2 (180 degrees) even where the test only commands part of the space
+PAN_PERIOD = 2.0
+DEFAULT_TOLERANCE = 0.005
+BASELINE_MARGIN = 0.25
+DEFAULT_WINDOW = 100000
+RECORD = np.dtype([('iteration', '<i8'), ('target', '<f8', 3), ('actual', '<f8', 3)])
+
+
+def read_records(path):
+    """
+    :param path: file written by DriftRecorder.save()
+    :return: array of RECORD, memory mapped so large runs are not read into memory
+    """
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r')
+
+
+class DriftRecorder(object):
+    def __init__(self, window=DEFAULT_WINDOW, pan_period=PAN_PERIOD):
+        """
+        :param window: number of iterations kept in memory, oldest are overwritten
+        :param pan_period: pan range after which pan wraps around
+        """
+        self.window = window
+        self.pan_period = pan_period
+        self.records = np.zeros(window, dtype=RECORD)
+        self.start = 0
+        self.count = 0
+        self.total = 0
+        self.unsaved = 0
+
+    def add(self, iteration, target, actual):
+        """
+        :param iteration: iteration number
+        :param target: (pan, tilt, zoom) home position set before reboot
+        :param actual: (pan, tilt, zoom) position read after reboot
+        """
+        if self.count < self.window:
+            slot = (self.start + self.count) % self.window
+            self.count += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.window
+        self.records[slot] = (iteration, target, actual)
+        self.total += 1
+        self.unsaved = min(self.unsaved + 1, self.window)
+
+    def ordered(self, last=None):
+        """
+        :param last: only the last iterations, all kept ones if None
+        :return: array of RECORD, oldest first
+        """
+        records = np.roll(self.records[:self.count], -self.start)
+        return records if last is None else records[self.count - last:]
+
+    def errors(self):
+        records = self.ordered()
+        return drift_errors(records['target'], records['actual'], self.pan_period)
+
+    def save(self, path):
+        """
+        Append the iterations added since the previous save to path, call it at least every 'window' iterations
+        """
+        with open(path, 'ab') as f:
+            self.ordered(self.unsaved).tofile(f)
+        self.unsaved = 0
+
+    def resume(self, path):
+        """
+        After rebuilding the recorder of a resumed run, drop iterations from path that are not
+        in the recorder and save only the ones missing from path
+        """
+        if not os.path.exists(path):
+            self.unsaved = self.count
+            return
+        iterations = self.ordered()['iteration']
+        saved = read_records(path)['iteration']
+        last = iterations[-1] if len(iterations) else 0
+        keep = int(np.searchsorted(saved, last, side='right'))
+        last_saved = int(saved[keep - 1]) if keep else -1
+        del saved
+        with open(path, 'r+b') as f:
+            f.truncate(keep * RECORD.itemsize)
+        self.unsaved = int(np.count_nonzero(iterations > last_saved))
+
+    @classmethod
+    def load(cls, path, window=DEFAULT_WINDOW, pan_period=PAN_PERIOD):
+        """
+        :return: DriftRecorder with the last window iterations of path
+        """
+        records = read_records(path)[-window:]
+        recorder = cls(window, pan_period)
+        recorder.count = recorder.total = len(records)
+        recorder.records[:recorder.count] = records
+        return recorder
+
+
+def drift_errors(target, actual, pan_period=PAN_PERIOD):
+    """
+    Signed position errors, pan wrapped into -pan_period/2 .. pan_period/2
+    :param target: N x 3 array of (pan, tilt, zoom)
+    :param actual: N x 3 array of (pan, tilt, zoom)
+    :return: N x 3 array of actual - target
+    """
+    errors = np.asarray(actual, dtype=float) - np.asarray(target, dtype=float)
+    half = pan_period / 2.0
+    errors[:, 0] = np.mod(errors[:, 0] + half, pan_period) - half
+    return errors
+
+
+def drift_stats(errors):
+    """
+    Per axis error statistics
+    :param errors: N x 3 array from drift_errors()
+    :return: dict axis -> dict with mean, p95 and max absolute error, bias and rms
+    """
+    if not len(errors):
+        return {}
+    absolute = np.abs(errors)
+    mean = absolute.mean(axis=0)
+    p95 = np.percentile(absolute, 95, axis=0)
+    worst = absolute.max(axis=0)
+    bias = errors.mean(axis=0)
+    rms = np.sqrt((errors ** 2).mean(axis=0))
+    return dict((axis, {'mean': mean[i], 'p95': p95[i], 'max': worst[i], 'bias': bias[i], 'rms': rms[i]})
+                for i, axis in enumerate(AXES))
+
+
+def flag_regressions(stats, tolerance=DEFAULT_TOLERANCE, baseline=None, margin=BASELINE_MARGIN):
+    """
+    :param stats: drift_stats() of the run
+    :param tolerance: largest acceptable p95 absolute error per axis
+    :param baseline: optional drift_stats() of a known good run
+    :param margin: allowed relative p95 increase over baseline
+    :return: list of regression messages, empty if none
+    """
+    messages = []
+    for axis, axis_stats in sorted(stats.items()):
+        if axis_stats['p95'] > tolerance:
+            messages.append('%s p95 drift %.6f exceeds tolerance %.6f' % (axis, axis_stats['p95'], tolerance))
+        if baseline and axis in baseline:
+            limit = baseline[axis]['p95'] * (1 + margin)
+            if axis_stats['p95'] > limit and axis_stats['p95'] > tolerance / 10:
+                messages.append('%s p95 drift %.6f regressed from baseline %.6f'
+                                % (axis, axis_stats['p95'], baseline[axis]['p95']))
+    return messages
+
+
+def format_stats(stats):
+    lines = ['axis      mean       p95        max        bias       rms']
+    for axis in AXES:
+        if axis in stats:
+            s = stats[axis]
+            lines.append('%-6s %10.6f %10.6f %10.6f %10.6f %10.6f' % (axis, s['mean'], s['p95'], s['max'],
+                                                                      s['bias'], s['rms']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="PTZ home position drift analysis")
+    parser.add_argument('drift_file', help="file saved by DriftRecorder.save()")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="acceptable p95 error per axis")
+    parser.add_argument('--baseline', help="drift file of a known good run")
+    parser.add_argument('--pan-period', type=float, default=PAN_PERIOD, help="pan range after which pan wraps")
+    args = parser.parse_args()
+
+    def file_stats(path):
+        records = read_records(path)
+        return len(records), drift_stats(drift_errors(records['target'], records['actual'], args.pan_period))
+
+    count, stats = file_stats(args.drift_file)
+    baseline = file_stats(args.baseline)[1] if args.baseline else None
+    print('%d iterations' % count)
+    print(format_stats(stats))
+    regressions = flag_regressions(stats, args.tolerance, baseline)
+    for message in regressions:
+        print('REGRESSION: %s' % message)
+    sys.exit(1 if regressions else 0)
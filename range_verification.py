@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Verification of accepted parameter ranges
+-----------------------------------------
+
+Setting every value of a range and reading it back costs two requests per
+value, 7000 requests for the 60..3600 s tamper timeout. RangeVerifier checks
+ranges with one of three strategies:
+
+    exhaustive  every value of the range
+    sampled     both ends and their neighbours plus one random value from each
+                of 'samples' equal strata of the range (seeded, repeatable)
+    bisect      both ends, then midpoints of ever smaller halves up to 'samples'
+                values; the first failing value next to a passing one is located
+                by bisection
+
+Several parameters are written in one request and verified with one read. If
+a combined write fails, its parameters are retried one by one so the failure
+is reported against the right parameter:
+
+    verifier = RangeVerifier(write, read)
+    reports = verifier.verify({'Sensitivity': (1, 10), 'Timeout': (60, 3600)}, 'sampled')
+"""
+import time
+from random import Random
+
+STRATEGIES = ('exhaustive', 'sampled', 'bisect')
+DEFAULT_SAMPLES = 32
+
+
+def plan_values(low, high, strategy='exhaustive', samples=DEFAULT_SAMPLES, rng=None):
+    """
+    :param low: lowest value of the range
+    :param high: highest value of the range
+    :param strategy: one of STRATEGIES
+    :param samples: number of strata or bisection values
+    :param rng: random.Random used by 'sampled'
+    :return: list of values to verify, in order
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("Unknown range strategy '%s', expected one of %s" % (strategy, ', '.join(STRATEGIES)))
+    if strategy == 'exhaustive' or high - low + 1 <= samples:
+        return list(range(low, high + 1))
+
+    values = []
+    seen = set()
+
+    def add(value):
+        if low <= value <= high and value not in seen:
+            seen.add(value)
+            values.append(value)
+
+    if strategy == 'sampled':
+        rng = rng or Random(0)
+        for value in (low, low + 1, high - 1, high):
+            add(value)
+        width = (high - low + 1) / float(samples)
+        for stratum in range(samples):
+            add(rng.randrange(low + int(stratum * width), low + max(int((stratum + 1) * width), 1)))
+        return values
+
+    add(low)
+    add(high)
+    intervals = [(low, high)]
+    while intervals and len(values) < samples:
+        next_intervals = []
+        for a, b in intervals:
+            if b - a > 1 and len(values) < samples:
+                middle = (a + b) // 2
+                add(middle)
+                next_intervals.extend([(a, middle), (middle, b)])
+        intervals = next_intervals
+    return values
+
+
+class RangeReport(object):
+    """
+    Result of verifying one parameter range
+    """
+    def __init__(self, name, low, high, strategy):
+        self.name = name
+        self.low = low
+        self.high = high
+        self.strategy = strategy
+        self.passed = set()
+        self.failures = {}
+        self.boundaries = []
+
+    def record(self, value, ok, read_value):
+        if ok:
+            self.passed.add(value)
+        else:
+            self.failures[value] = read_value
+
+    @property
+    def tested(self):
+        return len(self.passed) + len(self.failures)
+
+    @property
+    def coverage(self):
+        return 100.0 * self.tested / (self.high - self.low + 1)
+
+    def format(self):
+        text = '%s %d..%d (%s): %d of %d values verified (%.1f%%), %d failed' % (
+            self.name, self.low, self.high, self.strategy, self.tested, self.high - self.low + 1,
+            self.coverage, len(self.failures))
+        if self.boundaries:
+            text += ', first failing values next to passing ones: %s' % ', '.join(str(b) for b in self.boundaries)
+        return text
+
+
+class RangeVerifier(object):
+    def __init__(self, write, read, isolate=True):
+        """
+        :param write: callable(dict name -> value), returns True if the camera accepted the values
+        :param read: callable() returning dict name -> current value
+        :param isolate: retry parameters of a failed combined write one by one
+        """
+        self.write = write
+        self.read = read
+        self.isolate = isolate
+        self.writes = 0
+        self.reads = 0
+        self.elapsed = 0.0
+
+    def _check(self, params):
+        """
+        :return: dict name -> (ok, value read back)
+        """
+        accepted = self.write(params)
+        self.writes += 1
+        current = self.read()
+        self.reads += 1
+        return dict((name, (bool(accepted) and current.get(name) == value, current.get(name)))
+                    for name, value in params.items())
+
+    def _check_value(self, report, value):
+        ok, read_value = self._check({report.name: value})[report.name]
+        report.record(value, ok, read_value)
+        return ok
+
+    def verify(self, ranges, strategy='exhaustive', samples=DEFAULT_SAMPLES, seed=0):
+        """
+        :param ranges: dict parameter name -> (low, high)
+        :param strategy: one of STRATEGIES
+        :param samples: number of strata or bisection values per parameter
+        :param seed: seed of the 'sampled' strategy
+        :return: dict parameter name -> RangeReport
+        """
+        start = time.time()
+        rng = Random(seed)
+        plans = dict((name, plan_values(low, high, strategy, samples, rng)) for name, (low, high) in ranges.items())
+        reports = dict((name, RangeReport(name, low, high, strategy)) for name, (low, high) in ranges.items())
+
+        for i in range(max(len(values) for values in plans.values())):
+            params = dict((name, values[i]) for name, values in plans.items() if i < len(values))
+            results = self._check(params)
+            for name, (ok, read_value) in results.items():
+                if not ok and len(params) > 1 and self.isolate:
+                    ok, read_value = self._check({name: params[name]})[name]
+                reports[name].record(params[name], ok, read_value)
+
+        if strategy == 'bisect':
+            for report in reports.values():
+                self._locate_boundaries(report)
+        self.elapsed += time.time() - start
+        return reports
+
+    def _locate_boundaries(self, report):
+        tested = sorted(report.passed | set(report.failures))
+        for lower, upper in zip(tested, tested[1:]):
+            lower_ok, upper_ok = lower in report.passed, upper in report.passed
+            if lower_ok == upper_ok:
+                continue
+            # invariant: lower and upper differ in result, narrow down to adjacent values
+            while upper - lower > 1:
+                middle = (lower + upper) // 2
+                if self._check_value(report, middle) == lower_ok:
+                    lower = middle
+                else:
+                    upper = middle
+            report.boundaries.append(lower if not lower_ok else upper)
+
+    @property
+    def requests(self):
+        return self.writes + self.reads
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Coalescing of reboots and factory resets between settings tests
+----------------------------------------------------------------
+
+Persistence and restore defaults tests all follow the same pattern: write
+some settings, reboot or restore factory defaults, check the settings. The
+scheduler collects these tests, runs the writes of every test waiting for the
+same event, triggers the event once and then runs all checks:
+
+    scheduler = RebootScheduler(camera)
+    scheduler.add(REBOOT, 'ONVIF persistence', onvif_setup, onvif_check)
+    scheduler.add(REBOOT, 'Web persistence', web_setup, web_check)
+    scheduler.add(FACTORY_DEFAULTS, 'Web defaults', web_defaults_setup, web_defaults_check)
+    scheduler.run()                      # one reboot, then one factory reset
+
+Reboot tests run before factory reset tests, as a reset would undo the
+settings they check. Setups waiting for the same event must not write
+conflicting values.
+"""
+REBOOT = 'reboot'
+FACTORY_DEFAULTS = 'factory defaults'
+EVENTS = (REBOOT, FACTORY_DEFAULTS)
+
+
+class RebootScheduler(object):
+    def __init__(self, camera, reboot=None, factory_defaults=None):
+        """
+        :param camera: Camera object
+        :param reboot: callable() rebooting the camera, default camera.reboot
+        :param factory_defaults: callable() restoring factory defaults, default camera.set_factory_defaults
+        """
+        self.camera = camera
+        # looked up on the camera when the event runs, tests may wrap them after this
+        self.actions = {REBOOT: reboot or (lambda: camera.reboot()),
+                        FACTORY_DEFAULTS: factory_defaults or (lambda: camera.set_factory_defaults())}
+        self.pending = dict((event, []) for event in EVENTS)
+        self.performed = dict((event, 0) for event in EVENTS)
+        self.tests = 0
+
+    def add(self, event, name, setup, check):
+        """
+        :param event: REBOOT or FACTORY_DEFAULTS
+        :param name: test name for the log
+        :param setup: callable() writing the settings before the event
+        :param check: callable() verifying the settings after the event
+        """
+        if event not in self.pending:
+            raise ValueError("Unknown event '%s', expected one of %s" % (event, ', '.join(EVENTS)))
+        self.pending[event].append((name, setup, check))
+
+    def run(self):
+        """
+        Run pending tests, one event for all tests waiting for it
+        :return: number of events performed
+        """
+        performed = 0
+        for event in EVENTS:
+            tests, self.pending[event] = self.pending[event], []
+            if not tests:
+                continue
+            for name, setup, check in tests:
+                self.camera.logger.info("Setting up %s" % name)
+                setup()
+            self.camera.logger.info("Performing %s for %d test(s): %s" %
+                                    (event, len(tests), ', '.join(name for name, setup, check in tests)))
+            self.actions[event]()
+            self.performed[event] += 1
+            performed += 1
+            for name, setup, check in tests:
+                self.camera.logger.info("Checking %s after %s" % (name, event))
+                check()
+            self.tests += len(tests)
+        return performed
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Repeated Reboot Test on many cameras at once
+--------------------------------------------
+
+Runs repeated_reboot_test on every camera of an IP,User,Passwd inventory, one
+worker thread per camera. Cameras spend most of an iteration waiting for the
+reboot, so running them side by side makes soak throughput scale with the
+number of cameras on the bench. A failing or crashing camera does not stop
+the others. Each camera gets its own copy of the test arguments with its IP
+added to the journal, samples, drift, latency and log paths. At the end the
+iteration phase latencies of all cameras are merged per firmware.
+
+Usage:
+    python reboot_soak_runner.py cameras.txt --repeat 1000 --wait 5
+"""
+import sys
+import time
+import argparse
+import threading
+from tabulate import tabulate
+import camera_pool
+from fleet_inventory import read_inventory
+from latency_histogram import histograms_for, by_firmware
+from repeated_reboot_test import repeated_reboot_test, per_camera_arguments
+
+HEADERS = ['IP', 'Model', 'FW Version', 'Iterations', 'Failed checks', 'Status', 'Duration (s)']
+
+
+class CameraSoak(object):
+    """
+    Progress and result of the soak on one camera
+    """
+    def __init__(self, credentials, repeat, wait):
+        self.ip, self.user, self.password = credentials
+        self.repeat = repeat
+        self.wait = wait
+        self.camera = None
+        self.iterations = 0
+        self.failures = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def on_iteration(self, iteration, fail_count):
+        self.iterations = iteration
+        self.failures = fail_count
+
+    def run(self):
+        self.started = time.time()
+        try:
+            self.camera = camera_pool.get_camera(self.user, self.password, self.ip)
+            # journal, samples, drift, latency and log paths of this camera only
+            self.camera.arguments = per_camera_arguments(self.camera.arguments, self.ip)
+            self.camera.arguments['repeat'] = self.repeat
+            self.camera.arguments['wait'] = self.wait
+            self.camera.logger.info('Starting Repeated Reboot Test on %s' % self.ip)
+            self.failures = repeated_reboot_test(self.camera, total_repeat=self.repeat,
+                                                 on_iteration=self.on_iteration)
+        except Exception as e:
+            self.error = e
+            camera_pool.discard(self.user, self.password, self.ip)
+        finally:
+            self.finished = time.time()
+
+    @property
+    def status(self):
+        if self.finished is None:
+            return 'RUNNING'
+        if self.error is not None:
+            return 'ERROR: %s' % self.error
+        return 'PASS' if self.failures == 0 else 'FAIL'
+
+    def row(self):
+        props = self.camera.cp.props if self.camera is not None else {}
+        duration = (self.finished or time.time()) - self.started if self.started else 0
+        return [self.ip, props.get('Model', ''), props.get('FirmwareVersion', ''), self.iterations,
+                self.failures, self.status, '%.0f' % duration]
+
+
+def run_soak(inventory, repeat=1, wait=0, report_every=60, out=sys.stdout):
+    """
+    Run repeated_reboot_test on all cameras in parallel
+    :param inventory: iterable of [IP, User, Passwd] lists
+    :param repeat: iterations per camera
+    :param wait: seconds between iterations
+    :param report_every: seconds between progress tables
+    :return: list of CameraSoak results
+    """
+    soaks = [CameraSoak(credentials, repeat, wait) for credentials in inventory]
+    threads = []
+    for soak in soaks:
+        t = threading.Thread(target=soak.run, name='soak-%s' % soak.ip)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    last_report = time.time()
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(1)
+            if time.time() - last_report >= report_every:
+                last_report = time.time()
+                out.write('%s\n' % tabulate([soak.row() for soak in soaks], HEADERS, tablefmt='grid'))
+                out.flush()
+    return soaks
+
+
+def latency_by_firmware(soaks):
+    """
+    :return: dict firmware -> PhaseHistograms merged over all cameras running it
+    """
+    return by_firmware((soak.camera.cp.props, histograms_for(soak.camera))
+                       for soak in soaks if soak.camera is not None)
+
+
+def summary(soaks):
+    """
+    :return: aggregate counts over all cameras
+    """
+    return {'cameras': len(soaks),
+            'passed': sum(1 for soak in soaks if soak.status == 'PASS'),
+            'failed': sum(1 for soak in soaks if soak.status == 'FAIL'),
+            'errors': sum(1 for soak in soaks if soak.error is not None),
+            'iterations': sum(soak.iterations for soak in soaks),
+            'failed_checks': sum(soak.failures for soak in soaks)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run Repeated Reboot Test on many cameras in parallel")
+    parser.add_argument('camFile', help="inventory file, one 'IP,User,Passwd' per line")
+    parser.add_argument('--repeat', type=int, default=1, help="iterations per camera")
+    parser.add_argument('--wait', type=float, default=0, help="seconds between iterations")
+    parser.add_argument('--report-every', type=float, default=60, help="seconds between progress tables")
+    args = parser.parse_args()
+
+    soaks = run_soak(read_inventory(args.camFile), args.repeat, args.wait, args.report_every)
+    print(tabulate([soak.row() for soak in soaks], HEADERS, tablefmt='grid'))
+    for firmware, latency in sorted(latency_by_firmware(soaks).items()):
+        print('Reboot iteration phase latency (s), firmware %s:\n%s' % (firmware, latency.format()))
+    totals = summary(soaks)
+    print('Cameras: %(cameras)d, passed: %(passed)d, failed: %(failed)d, errors: %(errors)d, '
+          'iterations: %(iterations)d, failed checks: %(failed_checks)d' % totals)
+    sys.exit(0 if totals['passed'] == totals['cameras'] else 1)
@@ -11,15 +11,61 @@ Steps:
 4) Reboot camera
 5) Check VAL status
 """
+import os
 import time
-from random import randrange
+import weakref
+from random import randrange, Random, SystemRandom
 from CameraController.device.camera import Camera
+from sample_ring import ring_for, record_position, record_val_status
+from run_journal import RunJournal
+from camera_log_store import process_new_logs
+from latency_histogram import histograms_for, phase_durations, save as save_latency
+try:
+    from ptz_drift import DriftRecorder, drift_stats, flag_regressions, format_stats, DEFAULT_TOLERANCE, PAN_PERIOD
+except ImportError:  # NumPy not installed, drift analysis disabled
+    DriftRecorder = None
 
 MOVE_TIMEOUT_SECONDS = 10
 POLL_TIME = 0.5
+FINE_POLL_TIME = 0.1
 MOVE_SPEED = 0.8
 PAN_TILT_STEPS = 99840
 ZOOM_STEPS = 16384
+# initial motion model, refined from measured moves during the run
+SECONDS_PER_UNIT = 2.0
+MOVE_OVERHEAD_SECONDS = 0.3
+ESTIMATE_SLEEP_FRACTION = 0.8
+DRIFT_SAVE_EVERY = 100
+BOOT_TIMEOUT_SECONDS = 60
+STREAM_TIMEOUT_SECONDS = 30
+VAL_STATUS_TIMEOUT = 5
+READY_POLL_TIME = 0.5
+# arguments naming files or directories written by one camera's run
+PATH_ARGUMENTS = ('journal_file', 'samples_file', 'drift_file', 'latency_file', 'log_dir')
+
+
+class MoveTimer(object):
+    """
+    Estimates PTZ move duration from travelled distance and speed, and learns
+    seconds per unit of distance from the measured moves
+    """
+    def __init__(self, seconds_per_unit=SECONDS_PER_UNIT, overhead=MOVE_OVERHEAD_SECONDS, smoothing=0.2):
+        self.seconds_per_unit = seconds_per_unit
+        self.overhead = overhead
+        self.smoothing = smoothing
+
+    def estimate(self, distance, speed=MOVE_SPEED):
+        return self.overhead + distance * self.seconds_per_unit / speed
+
+    def record(self, distance, speed, elapsed):
+        if distance > 0.01:
+            measured = max(elapsed - self.overhead, 0) * speed / distance
+            self.seconds_per_unit += self.smoothing * (measured - self.seconds_per_unit)
+
+
+# camera -> {axis: MoveTimer}, PanTilt and Zoom move at different rates and
+# cameras may run in parallel (reboot_soak_runner.py)
+move_timers = weakref.WeakKeyDictionary()
 
 
 def test_repeated_reboot_test(camera):
@@ -31,46 +77,169 @@ def test_repeated_reboot_test(camera):
     if 'repeat' in camera.arguments:
         repeats = camera.arguments['repeat']
 
-    repeated_reboot_test(camera, total_repeat=repeats)
+    fail_count = repeated_reboot_test(camera, total_repeat=repeats)
+
+    assert fail_count == 0
 
-    assert camera.logger.get_fail_count() == 0
+
+def per_camera_arguments(arguments, ip):
+    """
+    Copy of shared test arguments with the camera IP added to every PATH_ARGUMENTS
+    path, so cameras running side by side do not write to the same files
+    :param arguments: camera.arguments, possibly shared between cameras
+    :param ip: camera IP
+    :return: new arguments dict, for example 'run.jsonl' becomes 'run-10.0.0.5.jsonl'
+    """
+    arguments = dict(arguments)
+    for name in PATH_ARGUMENTS:
+        if arguments.get(name):
+            root, ext = os.path.splitext(arguments[name]) if name != 'log_dir' else (arguments[name], '')
+            arguments[name] = '%s-%s%s' % (root.rstrip('/\\'), ip, ext)
+    return arguments
 
 
-def repeated_reboot_test(camera, total_repeat=10000000):
+def repeated_reboot_test(camera, total_repeat=10000000, on_iteration=None):
+    """
+    If camera.arguments has 'journal_file', every finished iteration is appended to it
+    and a restarted run resumes after the last iteration found in the journal, with
+    the same random PTZ targets. Phase durations of every iteration are kept in
+    latency histograms, saved to 'latency_file' if given.
+    With 'log_dir' every iteration only stores the camera log lines added since the
+    previous one for later queries, and process_camera_logs() checks the log once at
+    the end of the run instead of after every iteration.
+    Failed checks of the iterations before a resume count towards the result.
+    :param on_iteration: optional callable(iteration, fail_count) called after every iteration
+    :return: number of failed checks of the whole run, resumed iterations included
+    """
     if 'G-' in camera.cp.props['Model']:
         stream_message = 'CreateStream'
     else:
         stream_message = 'PlayStream'
 
+    # PTZ and VAL samples of the whole run, appended to 'samples_file' if given
+    ring = ring_for(camera, path=camera.arguments.get('samples_file'))
+    drift = None
+    if DriftRecorder is not None:
+        # 'pan_period' for cameras whose pan space is not the ONVIF generic -1..1
+        drift = DriftRecorder(pan_period=camera.arguments.get('pan_period', PAN_PERIOD))
+    latency = histograms_for(camera)
+    log_dir = camera.arguments.get('log_dir')
+
+    journal = None
+    first_repeat = 1
+    # failed checks logged before a resume, the logger of this process starts from zero
+    resumed_failures = 0
+    seed = camera.arguments.get('seed')
+    if camera.arguments.get('journal_file'):
+        journal = RunJournal(camera.arguments['journal_file'])
+        header = journal.start({'seed': seed if seed is not None else SystemRandom().randrange(2 ** 31),
+                                'total_repeat': total_repeat, 'model': camera.cp.props.get('Model'),
+                                'firmware': camera.cp.props.get('FirmwareVersion')})
+        seed = header['seed']
+        first_repeat = journal.last_iteration() + 1
+        if first_repeat > 1:
+            resumed_failures = journal.last.get('fail_count', 0)
+            camera.logger.info("Resuming repeated Reboot after iteration %d from %s, %d failed checks so far" %
+                               (first_repeat - 1, journal.path, resumed_failures))
+            if drift is not None:
+                for record in journal.records():
+                    if record.get('home') and record.get('position'):
+                        drift.add(record['iteration'], record['home'], record['position'])
+                if camera.arguments.get('drift_file'):
+                    drift.resume(camera.arguments['drift_file'])
+            for record in journal.records():
+                latency.add(record.get('phases', {}))
+
     camera.avigilon_client.goto_ptz_home(camera)
     camera.ptz_client.wait_for_move_finish(timeout=10, poll_time=0.5)
     get_ptz_position(camera)
     check_val_status(camera, 'NOT PAUSED')
 
-    for total_repeat_count in range(1, total_repeat + 1):
+    for total_repeat_count in range(first_repeat, total_repeat + 1):
+        iteration_start = time.time()
         camera.logger.info("~~~~~~~~~~~ Running %d of %d  iteration of repeated Reboot ~~~~~~~~~~~~" %
                            (total_repeat_count, total_repeat))
 
         cl = camera.get_camera_log()
 
-        set_random_ptz_position(camera)
-        get_ptz_position(camera)
+        marks = [('start', time.time())]
+        rng = Random(seed * 10000019 + total_repeat_count) if seed is not None else None
+        target = set_random_ptz_position(camera, rng)
+        home = get_ptz_position(camera)
+        marks.append(('move', time.time()))
         camera.logger.info("Set current position as Home")
         # camera.ptz_client.create_preset('preset000')
         camera.avigilon_client.set_ptz_home(camera)
+        marks.append(('set_home', time.time()))
 
         camera.reboot()
-        camera.logger.logresult(cl.wait_for_logmessage(stream_message, timeout=30), 'Camera logged "%s ... "' %
-                                stream_message)
-        time.sleep(10)
-        camera.ptz_client.wait_for_move_finish(timeout=10, poll_time=0.5)
-        get_ptz_position(camera)
-        check_val_status(camera, 'NOT PAUSED')
+        marks.append(('reboot', time.time()))
+        ready, reason, timings = wait_for_camera_ready(camera, cl, stream_message)
+        camera.logger.logresult(ready, 'Camera ready after reboot: %s' % reason)
+        position = get_ptz_position(camera)
+        val_status = check_val_status(camera, 'NOT PAUSED')
+        if drift is not None:
+            drift.add(total_repeat_count, home, position)
+            if total_repeat_count % DRIFT_SAVE_EVERY == 0:
+                report_drift(camera, drift)
 
-        camera.process_camera_logs('REPEATED REBOOT TEST')
+        logs_start = time.time()
+        if log_dir:
+            process_new_logs(camera, 'REPEATED REBOOT TEST', log_dir)
+        else:
+            camera.process_camera_logs('REPEATED REBOOT TEST')
+        phases = phase_durations(marks, timings)
+        phases['logs'] = time.time() - logs_start
+        latency.add(phases)
+        camera.logger.info("Iteration phases: %s" %
+                           ', '.join('%s %.2f s' % (phase, phases[phase]) for phase in latency.ordered()
+                                     if phase in phases))
+
+        if journal is not None:
+            journal.append({'iteration': total_repeat_count, 'seed': seed, 'target': target, 'home': home,
+                            'position': position, 'ready': ready, 'reason': reason, 'val_status': val_status,
+                            'fail_count': resumed_failures + camera.logger.get_fail_count(), 'timings': timings,
+                            'phases': phases, 'duration': time.time() - iteration_start, 'time': time.time()})
+
+        if on_iteration is not None:
+            on_iteration(total_repeat_count, resumed_failures + camera.logger.get_fail_count())
 
         time.sleep(camera.arguments['wait'])
 
+    ring.flush()
+    if log_dir:
+        camera.process_camera_logs('REPEATED REBOOT TEST')
+    if journal is not None:
+        journal.close()
+    report_latency(camera, latency)
+    if drift is not None:
+        report_drift(camera, drift)
+    return resumed_failures + camera.logger.get_fail_count()
+
+
+def report_drift(camera, drift):
+    """
+    log home position drift statistics of the recorder window, warn about drift over
+    'drift_tolerance' and append the new iterations to 'drift_file' if given
+    """
+    stats = drift_stats(drift.errors())
+    camera.logger.info("Home position drift over the last %d of %d reboots:\n%s"
+                       % (drift.count, drift.total, format_stats(stats)))
+    for message in flag_regressions(stats, camera.arguments.get('drift_tolerance', DEFAULT_TOLERANCE)):
+        camera.logger.warning("Home position drift: %s" % message)
+    if camera.arguments.get('drift_file'):
+        drift.save(camera.arguments['drift_file'])
+
+
+def report_latency(camera, latency):
+    """
+    log p50, p95 and p99 of every iteration phase and save the histograms to 'latency_file' if given
+    """
+    camera.logger.info("Reboot iteration phase latency (s):\n%s" % latency.format())
+    if camera.arguments.get('latency_file'):
+        save_latency(camera.arguments['latency_file'], latency, model=camera.cp.props.get('Model'),
+                     firmware=camera.cp.props.get('FirmwareVersion'))
+
 
 def get_ptz_position(camera):
     """
@@ -78,37 +247,139 @@ def get_ptz_position(camera):
     """
     pos = camera.ptz_client.get_status().Position
     camera.logger.info("Current Pan: %f, Tilt: %f, Zoom: %f" % (pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x))
+    record_position(camera, pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x)
     return pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x
 
 
-def check_val_status(camera, paused):
+def check_val_status(camera, paused, timeout=VAL_STATUS_TIMEOUT):
     """
-    check val status after delay
+    check val status, waiting up to timeout seconds for it to become 'paused'
     """
-    time.sleep(5)
-    val_status = camera.avigilon_client.get_val_status()
+    deadline = time.time() + timeout
+    while True:
+        val_status = camera.avigilon_client.get_val_status()
+        record_val_status(camera, val_status)
+        if val_status == paused or time.time() >= deadline:
+            break
+        time.sleep(READY_POLL_TIME)
     camera.logger.logresult(val_status == paused, 'Verify VAL is %s' % paused)
     return val_status
 
 
-def set_random_ptz_position(camera):
+def wait_for_camera_ready(camera, cl, stream_message, val_status='NOT PAUSED', timeout=BOOT_TIMEOUT_SECONDS):
+    """
+    wait until rebooted camera streams, PTZ is idle at the same position on two polls in a row
+    and VAL reports the expected status. Position errors are left to the drift analysis.
+    :param cl: camera log created before the reboot
+    :param stream_message: log message that marks the video stream started
+    :param val_status: expected VAL status
+    :param timeout: seconds allowed for the whole boot
+    :return: (ready, reason, timings) where reason explains the first phase that did not complete
+             and timings maps phase name to seconds since the probe started
+    """
+    start = time.time()
+    deadline = start + timeout
+    timings = {}
+
+    stream_timeout = min(STREAM_TIMEOUT_SECONDS, timeout)
+    if not cl.wait_for_logmessage(stream_message, timeout=stream_timeout):
+        return False, 'camera did not log "%s" within %d s' % (stream_message, stream_timeout), timings
+    timings['stream'] = time.time() - start
+
+    last_error = None
+    previous = None
+    while True:
+        try:
+            status = camera.ptz_client.get_status()
+            pos = status.Position
+            position = (pos.PanTilt._x, pos.PanTilt._y, pos.Zoom._x)
+            if not (is_idle(status.MoveStatus.PanTilt) and is_idle(status.MoveStatus.Zoom)):
+                position = None
+                last_error = 'PTZ still moving'
+            elif position == previous:
+                break
+            else:
+                last_error = 'PTZ position not settled'
+            previous = position
+        except Exception as e:
+            previous = None
+            last_error = 'PTZ status not reachable: %s' % e
+        if time.time() >= deadline:
+            return False, last_error, timings
+        time.sleep(READY_POLL_TIME)
+    timings['ptz'] = time.time() - start
+
+    while True:
+        try:
+            current = camera.avigilon_client.get_val_status()
+            if current == val_status:
+                break
+            last_error = 'VAL status is %s (expected %s)' % (current, val_status)
+        except Exception as e:
+            last_error = 'VAL status not reachable: %s' % e
+        if time.time() >= deadline:
+            return False, last_error, timings
+        time.sleep(READY_POLL_TIME)
+    timings['val'] = time.time() - start
+
+    return True, 'ready after %.1f s' % timings['val'], timings
+
+
+def is_idle(move_status):
+    return str(move_status).upper() == 'IDLE'
+
+
+def wait_for_ptz_move(camera, distance, axis='PanTilt', timeout=MOVE_TIMEOUT_SECONDS):
+    """
+    sleep most of the expected move time, then poll move status at FINE_POLL_TIME
+    :param distance: largest distance one of the moving axes has to travel
+    :param axis: 'PanTilt' or 'Zoom' MoveStatus field
+    :return: True if move finished before timeout
+    """
+    timer = move_timers.setdefault(camera, {}).setdefault(axis, MoveTimer())
+    start = time.time()
+    expected = timer.estimate(distance)
+    time.sleep(min(expected * ESTIMATE_SLEEP_FRACTION, timeout))
+
+    finished = False
+    while True:
+        if is_idle(getattr(camera.ptz_client.get_status().MoveStatus, axis)):
+            finished = True
+            break
+        if time.time() - start >= timeout:
+            break
+        time.sleep(FINE_POLL_TIME)
+
+    elapsed = time.time() - start
+    if finished:
+        timer.record(distance, MOVE_SPEED, elapsed)
+    camera.logger.info("%s move of %.4f took %.2f s (expected %.2f s)" % (axis, distance, elapsed, expected))
+    return finished
+
+
+def set_random_ptz_position(camera, rng=None):
     """
     move to random ptz position
+    :param rng: optional random.Random, makes the position reproducible from its seed
     """
+    random_range = rng.randrange if rng is not None else randrange
     # random_pan, random_tilt, random_zoom = random(), random(), random()
-    random_pan, random_tilt, random_zoom = randrange(PAN_TILT_STEPS) / float(PAN_TILT_STEPS), \
-                                           randrange(PAN_TILT_STEPS) / float(PAN_TILT_STEPS), \
-                                           randrange(ZOOM_STEPS) / float(ZOOM_STEPS)
+    random_pan, random_tilt, random_zoom = random_range(PAN_TILT_STEPS) / float(PAN_TILT_STEPS), \
+                                           random_range(PAN_TILT_STEPS) / float(PAN_TILT_STEPS), \
+                                           random_range(ZOOM_STEPS) / float(ZOOM_STEPS)
     camera.logger.info("Moving to random Pan: %f, Tilt: %f, Zoom: %f" % (random_pan, random_tilt, random_zoom))
+    pos = camera.ptz_client.get_status().Position
     camera.ptz_client.set_position_absolute(random_pan, random_tilt, speed=MOVE_SPEED)
 
     # wait for move to end
-    move_completed = camera.ptz_client.wait_for_move_finish(timeout=MOVE_TIMEOUT_SECONDS, poll_time=POLL_TIME)
+    distance = max(abs(random_pan - pos.PanTilt._x), abs(random_tilt - pos.PanTilt._y))
+    move_completed = wait_for_ptz_move(camera, distance, 'PanTilt')
     if not move_completed:
-        camera.logger.warning("wait_for_move_finish timed out, operation may not have completed!")
+        camera.logger.warning("wait_for_ptz_move timed out, operation may not have completed!")
 
     camera.ptz_client.set_zoom_absolute(random_zoom, speed=MOVE_SPEED)
-    camera.ptz_client.monitor_zoom_status()
+    if not wait_for_ptz_move(camera, abs(random_zoom - pos.Zoom._x), 'Zoom'):
+        camera.logger.warning("Zoom move timed out, operation may not have completed!")
     return random_pan, random_tilt, random_zoom
 
 
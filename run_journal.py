@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Append-only journal of long test runs
+-------------------------------------
+
+Every finished iteration is appended as one JSON line. Lines are flushed to
+the OS immediately and fsync'ed every SYNC_EVERY records or SYNC_INTERVAL
+seconds, so a crash of the harness host loses at most the last few
+iterations and the run resumes after the last record found in the journal.
+
+    journal = RunJournal('reboot_run.jsonl')
+    header = journal.start({'seed': 1234, 'total_repeat': 1000})
+    for iteration in range(journal.last_iteration() + 1, 1001):
+        ...
+        journal.append({'iteration': iteration, 'ready': True})
+    journal.close()
+"""
+import json
+import os
+import time
+
+SYNC_EVERY = 10
+SYNC_INTERVAL = 30
+
+
+class RunJournal(object):
+    def __init__(self, path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        """
+        :param path: journal file, created if missing
+        :param sync_every: number of records between fsync calls
+        :param sync_interval: longest time in seconds between fsync calls
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.header = None
+        self.last = None
+        self._load()
+        self.f = open(path, 'a')
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                complete += len(line)
+                if not line.strip():
+                    continue
+                record = json.loads(line.decode('utf-8'))
+                if record.get('type') == 'start':
+                    if self.header is None:
+                        self.header = record
+                else:
+                    self.last = record
+        # drop a record torn by a crash in the middle of a write
+        if complete != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+
+    @staticmethod
+    def _parse(lines):
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+    def records(self):
+        """
+        Iteration records of the journal, read lazily from the file
+        """
+        with open(self.path) as f:
+            for record in self._parse(f):
+                if record.get('type') != 'start':
+                    yield record
+
+    def start(self, header):
+        """
+        Write the run header unless resuming a journal that already has one
+        :param header: run parameters, for example random seed and repeat count
+        :return: header of the run (the existing one when resuming)
+        """
+        if self.header is None:
+            self.header = dict(header, type='start', time=time.time())
+            self._write(self.header)
+            self.sync()
+        return self.header
+
+    def last_iteration(self):
+        """
+        :return: number of the last finished iteration, 0 if none
+        """
+        return self.last['iteration'] if self.last else 0
+
+    def append(self, record):
+        """
+        Add a finished iteration record, it must contain 'iteration'
+        """
+        self._write(record)
+        self.last = record
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every or time.time() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def _write(self, record):
+        self.f.write(json.dumps(record, sort_keys=True) + '\n')
+        self.f.flush()
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Fixed memory time series of PTZ position and VAL status samples
+----------------------------------------------------------------
+
+Samples are kept in arrays used as a ring buffer, so a multi-day soak uses the
+same memory as the first day. The arrays start small and double until they
+hold 'capacity' samples, so short lived or rarely polled cameras stay small. Optionally every sample is also
+appended to a binary file (RECORD format, little endian) in batches, which can
+be read back with read_samples() instead of parsing text logs.
+
+Usage:
+    ring = ring_for(camera)              # one ring per camera object
+    record_position(camera, pan, tilt, zoom)
+    record_val_status(camera, 'NOT PAUSED')
+    ring.range(t0, t1)                   # samples with t0 <= timestamp <= t1
+    ring.downsample(60)                  # one averaged sample per minute
+"""
+import struct
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+
+VAL_STATE_CODES = {'NOT PAUSED': 0, 'PAUSED': 1}
+VAL_STATE_NAMES = dict((code, name) for name, code in VAL_STATE_CODES.items())
+UNKNOWN_STATE = -1
+
+RECORD = struct.Struct('<dfffb')
+DEFAULT_CAPACITY = 24 * 3600
+INITIAL_SIZE = 256
+DEFAULT_FLUSH_EVERY = 600
+
+
+def val_state_code(val_status):
+    return VAL_STATE_CODES.get(val_status, UNKNOWN_STATE)
+
+
+class SampleRing(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None, flush_every=DEFAULT_FLUSH_EVERY):
+        """
+        :param capacity: number of samples kept in memory, oldest are overwritten
+        :param path: optional binary file samples are appended to
+        :param flush_every: number of new samples that triggers a write to path
+        """
+        self.capacity = capacity
+        self.path = path
+        self.flush_every = flush_every
+        size = min(capacity, INITIAL_SIZE)
+        self.ts = array('d', [0.0]) * size
+        self.pan = array('f', [0.0]) * size
+        self.tilt = array('f', [0.0]) * size
+        self.zoom = array('f', [0.0]) * size
+        self.state = array('b', [UNKNOWN_STATE]) * size
+        self.start = 0
+        self.count = 0
+        self.unflushed = 0
+        self.last = (0.0, 0.0, 0.0, UNKNOWN_STATE)
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, i):
+        return (self.start + i) % self.capacity
+
+    def _grow(self):
+        """
+        Double the arrays up to capacity, only called before the ring wraps (start is 0)
+        """
+        extra = min(len(self.ts), self.capacity - len(self.ts))
+        self.ts.extend(array('d', [0.0]) * extra)
+        self.pan.extend(array('f', [0.0]) * extra)
+        self.tilt.extend(array('f', [0.0]) * extra)
+        self.zoom.extend(array('f', [0.0]) * extra)
+        self.state.extend(array('b', [UNKNOWN_STATE]) * extra)
+
+    def append(self, ts, pan, tilt, zoom, state):
+        """
+        Add a sample, timestamps are expected in increasing order
+        :param state: VAL state code, see val_state_code()
+        """
+        if self.count < self.capacity:
+            if self.count == len(self.ts):
+                self._grow()
+            slot = self._slot(self.count)
+            self.count += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.ts[slot] = ts
+        self.pan[slot] = pan
+        self.tilt[slot] = tilt
+        self.zoom[slot] = zoom
+        self.state[slot] = state
+        self.last = (pan, tilt, zoom, state)
+        self.unflushed = min(self.unflushed + 1, self.capacity)
+        if self.path and self.unflushed >= self.flush_every:
+            self.flush()
+
+    def sample(self, i):
+        """
+        :param i: sample number, 0 is the oldest sample in memory
+        :return: (timestamp, pan, tilt, zoom, state code)
+        """
+        slot = self._slot(i)
+        return self.ts[slot], self.pan[slot], self.tilt[slot], self.zoom[slot], self.state[slot]
+
+    def _timestamps(self):
+        ring = self
+
+        class Timestamps(object):
+            def __len__(self):
+                return ring.count
+
+            def __getitem__(self, i):
+                return ring.ts[ring._slot(i)]
+
+        return Timestamps()
+
+    def range(self, t0=None, t1=None):
+        """
+        Samples with t0 <= timestamp <= t1 found by binary search
+        :return: list of (timestamp, pan, tilt, zoom, state code)
+        """
+        timestamps = self._timestamps()
+        first = 0 if t0 is None else bisect_left(timestamps, t0)
+        last = self.count if t1 is None else bisect_right(timestamps, t1)
+        return [self.sample(i) for i in range(first, last)]
+
+    def downsample(self, bucket_seconds, t0=None, t1=None):
+        """
+        Average pan, tilt and zoom per time bucket, state is the worst (highest) code seen
+        :return: list of (bucket start, pan, tilt, zoom, state code, number of samples)
+        """
+        buckets = []
+        current = None
+        for ts, pan, tilt, zoom, state in self.range(t0, t1):
+            bucket = ts - ts % bucket_seconds
+            if current is None or current[0] != bucket:
+                current = [bucket, 0.0, 0.0, 0.0, UNKNOWN_STATE, 0]
+                buckets.append(current)
+            current[1] += pan
+            current[2] += tilt
+            current[3] += zoom
+            current[4] = max(current[4], state)
+            current[5] += 1
+        return [(b[0], b[1] / b[5], b[2] / b[5], b[3] / b[5], b[4], b[5]) for b in buckets]
+
+    def flush(self):
+        """
+        Append samples not yet written to path
+        """
+        if not self.path or not self.unflushed:
+            return
+        with open(self.path, 'ab') as f:
+            for i in range(self.count - self.unflushed, self.count):
+                f.write(RECORD.pack(*self.sample(i)))
+        self.unflushed = 0
+
+
+def read_samples(path, t0=None, t1=None):
+    """
+    Read samples written by SampleRing.flush()
+    :return: generator of (timestamp, pan, tilt, zoom, state code)
+    """
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(RECORD.size * 4096)
+            if not data:
+                break
+            for offset in range(0, len(data) - len(data) % RECORD.size, RECORD.size):
+                sample = RECORD.unpack_from(data, offset)
+                if (t0 is None or sample[0] >= t0) and (t1 is None or sample[0] <= t1):
+                    yield sample
+
+
+_rings = weakref.WeakKeyDictionary()
+_rings_lock = threading.Lock()
+
+
+def ring_for(camera, **options):
+    """
+    Ring buffer of a camera object, created with options on first use
+    """
+    with _rings_lock:
+        ring = _rings.get(camera)
+        if ring is None:
+            ring = _rings[camera] = SampleRing(**options)
+        return ring
+
+
+def record_position(camera, pan, tilt, zoom):
+    ring = ring_for(camera)
+    ring.append(time.time(), pan, tilt, zoom, ring.last[3])
+
+
+def record_val_status(camera, val_status):
+    ring = ring_for(camera)
+    pan, tilt, zoom = ring.last[:3]
+    ring.append(time.time(), pan, tilt, zoom, val_state_code(val_status))
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+"""
+Simulated camera for offline benchmarking of the camera scripts
+---------------------------------------------------------------
+
+SimulatedCamera implements the part of CameraController.device.camera.Camera
+used by these scripts:
+
+- avigilon_client: gss, client.service.ExecuteConsoleCmd, get_val_status,
+  goto_ptz_home, set_ptz_home
+- camera_log.get_system_logs, get_camera_log().wait_for_logmessage
+- ptz_client: get_status, set_position_absolute, set_zoom_absolute,
+  wait_for_move_finish, monitor_zoom_status
+- analytics_client: get_supported_rule_by_name, get_rules, get_rule_by_name,
+  rule_service.ModifyRules, delete_rules
+- web_service_client: tamper sensitivity and trigger delay getters/setters
+- reboot, set_factory_defaults, logger
+
+Every remote call waits latency +- jitter seconds and fails with probability
+failure_rate. All randomness comes from a seeded generator, so runs with the
+same seed are repeatable.
+
+Usage:
+    camera = SimulatedCamera(ip='10.0.0.1', latency=0.05, jitter=0.02, failure_rate=0.01, seed=1)
+    GetCameraStatus.py cameras.txt --simulate --workers 50
+"""
+import logging
+import random
+import threading
+import time
+
+try:
+    from suds import WebFault
+except ImportError:
+    WebFault = None
+
+SIM_GSS = ("Rel %(days)dd%(hours)dh%(minutes)dm%(seconds)ds\n"
+           "Tasks 112\n"
+           "SysCpu %(sys_cpu).1f, %(sys_cpu5).1f, %(sys_cpu15).1f, ProcCpu %(proc_cpu).1f, SysMem %(sys_mem).1f%%\n"
+           " Id : Name Load Prio\n"
+           " 11 : -- Rtsp 0.4%% Prio 40 Stack 8192\n"
+           " 12 : -- ValService %(val_cpu).1f%% Prio 50 Stack 16384\n")
+
+TAMPER_RULE_NAME = 'Camera Tampering Rule'
+TAMPER_RULE_TYPE = 'tavg:CameraTampering'
+TAMPER_BOUNDS = {'Sensitivity': (1, 10, 8),
+                 'Duration': (1, 30, 8),
+                 'Timeout': (60, 3600, 300),
+                 'Enabled': (0, 1, 1)}
+
+
+class SimulatedFailure(Exception):
+    """
+    Injected failure of a simulated remote call
+    """
+
+
+def soap_fault(message):
+    """
+    Fault a real camera raises for a rejected SOAP call, WebFault when suds is installed
+    :param message: fault string
+    """
+    if WebFault is None:
+        return SimulatedFailure(message)
+    return WebFault(SudsObject(faultstring=message), None)
+
+
+class SudsObject(object):
+    """
+    Minimal stand-in for suds objects, supports both obj.name and obj['name']
+    """
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __repr__(self):
+        return 'SudsObject(%s)' % ', '.join('%s=%r' % item for item in sorted(self.__dict__.items()))
+
+
+class SimulatedLogger(object):
+    def __init__(self, name):
+        self.log = logging.getLogger(name)
+        self.fail_count = 0
+
+    def info(self, msg):
+        self.log.info(msg)
+
+    def warning(self, msg):
+        self.log.warning(msg)
+
+    def test_start_header(self, msg):
+        self.log.info('=== %s ===' % msg)
+
+    def logresult(self, result, msg):
+        if not result:
+            self.fail_count += 1
+        self.log.info('%s: %s' % ('PASS' if result else 'FAIL', msg))
+        return result
+
+    def get_fail_count(self):
+        return self.fail_count
+
+
+class SimulatedCameraLog(object):
+    def __init__(self, camera):
+        self.camera = camera
+        self.start = len(camera.system_log)
+
+    def get_system_logs(self):
+        self.camera.remote_call()
+        with self.camera.lock:
+            return list(self.camera.system_log)
+
+    def wait_for_logmessage(self, message, timeout=30):
+        deadline = time.time() + timeout
+        while True:
+            with self.camera.lock:
+                if any(message in line for line in self.camera.system_log[self.start:]):
+                    return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(min(0.1, max(deadline - time.time(), 0)))
+
+
+class _ConsoleService(object):
+    def __init__(self, camera):
+        self.camera = camera
+
+    def ExecuteConsoleCmd(self, session, command):
+        self.camera.remote_call()
+        for line in command.split('\n'):
+            self.camera.add_log('Console: %s' % line)
+        return SudsObject(Output='')
+
+
+class SimulatedAvigilonClient(object):
+    def __init__(self, camera):
+        self.camera = camera
+        self.client = SudsObject(service=_ConsoleService(camera))
+
+    def gss(self):
+        camera = self.camera
+        camera.remote_call()
+        uptime = int(time.time() - camera.boot_time)
+        minutes, seconds = divmod(uptime, 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        sys_cpu = camera.rng.uniform(5, 60)
+        if camera.rng.random() < camera.val_exception_rate:
+            camera.add_log('Vas.ValService VAL::EXCEPTION simulated exception')
+        return {'Output': SIM_GSS % dict(days=days, hours=hours, minutes=minutes, seconds=seconds,
+                                         sys_cpu=sys_cpu, sys_cpu5=sys_cpu * 0.9, sys_cpu15=sys_cpu * 0.8,
+                                         proc_cpu=camera.rng.uniform(1, 40), sys_mem=camera.rng.uniform(30, 70),
+                                         val_cpu=camera.rng.uniform(0.5, 5))}
+
+    def get_val_status(self):
+        self.camera.remote_call()
+        return 'PAUSED' if self.camera.ptz_client.moving() else 'NOT PAUSED'
+
+    def goto_ptz_home(self, camera=None):
+        pan, tilt, zoom = self.camera.home
+        self.camera.ptz_client.set_position_absolute(pan, tilt)
+        self.camera.ptz_client.set_zoom_absolute(zoom)
+
+    def set_ptz_home(self, camera=None):
+        self.camera.remote_call()
+        self.camera.home = self.camera.ptz_client.position()
+
+
+class SimulatedPtzClient(object):
+    """
+    Moves linearly from start to target at 'move_speed' units per second
+    """
+    def __init__(self, camera, move_speed=0.5):
+        self.camera = camera
+        self.move_speed = move_speed
+        self.start = [0.0, 0.0, 0.0]
+        self.target = [0.0, 0.0, 0.0]
+        self.move_start = [0.0, 0.0, 0.0]
+
+    def _axis(self, axis, now):
+        distance = self.target[axis] - self.start[axis]
+        travelled = (now - self.move_start[axis]) * self.move_speed
+        if travelled >= abs(distance):
+            return self.target[axis]
+        return self.start[axis] + travelled * (1 if distance > 0 else -1)
+
+    def position(self):
+        now = time.time()
+        return tuple(self._axis(axis, now) for axis in range(3))
+
+    def moving(self):
+        return self.position() != tuple(self.target)
+
+    def _move(self, axes, values):
+        now = time.time()
+        current = self.position()
+        for axis, value in zip(axes, values):
+            self.start[axis] = current[axis]
+            self.target[axis] = value
+            self.move_start[axis] = now
+
+    def get_status(self):
+        self.camera.remote_call()
+        pan, tilt, zoom = self.position()
+        now = time.time()
+        pan_tilt_moving = self._axis(0, now) != self.target[0] or self._axis(1, now) != self.target[1]
+        zoom_moving = self._axis(2, now) != self.target[2]
+        return SudsObject(Position=SudsObject(PanTilt=SudsObject(_x=pan, _y=tilt), Zoom=SudsObject(_x=zoom)),
+                          MoveStatus=SudsObject(PanTilt='MOVING' if pan_tilt_moving else 'IDLE',
+                                                Zoom='MOVING' if zoom_moving else 'IDLE'))
+
+    def set_position_absolute(self, pan, tilt, speed=None):
+        self.camera.remote_call()
+        self._move((0, 1), (pan, tilt))
+
+    def set_zoom_absolute(self, zoom, speed=None):
+        self.camera.remote_call()
+        self._move((2,), (zoom,))
+
+    def wait_for_move_finish(self, timeout=10, poll_time=0.5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.get_status().MoveStatus.PanTilt == 'IDLE':
+                return True
+            time.sleep(poll_time)
+        return False
+
+    def monitor_zoom_status(self, timeout=10, poll_time=0.5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.get_status().MoveStatus.Zoom == 'IDLE':
+                return True
+            time.sleep(poll_time)
+        return False
+
+
+class SimulatedAnalyticsClient(object):
+    def __init__(self, camera):
+        self.camera = camera
+        self.rule_service = SudsObject(ModifyRules=self.modify_rules)
+        self.settings = {}
+        self.reset()
+
+    def reset(self):
+        self.settings = dict((name, bounds[2]) for name, bounds in TAMPER_BOUNDS.items())
+
+    def get_supported_rule_by_name(self, rule_name=TAMPER_RULE_TYPE):
+        self.camera.remote_call()
+        bounds = [SudsObject(_Name=name, Bounds=SudsObject(Min={'_Value': str(low)}, Max={'_Value': str(high)}))
+                  for name, (low, high, default) in sorted(TAMPER_BOUNDS.items()) if name != 'Enabled']
+        defaults = [SudsObject(_Name=name, _Value=str(default))
+                    for name, (low, high, default) in sorted(TAMPER_BOUNDS.items())]
+        return SudsObject(_Name=rule_name, Extension=SudsObject(RuleDescriptionExtension=SudsObject(
+            SimpleItemBounds=bounds, SimpleItemDefaultValue=defaults)))
+
+    def _rule(self):
+        items = [SudsObject(_Name=name, _Value=str(value)) for name, value in sorted(self.settings.items())]
+        return SudsObject(_Name=TAMPER_RULE_NAME, _Type=TAMPER_RULE_TYPE, Parameters=SudsObject(SimpleItem=items))
+
+    def get_rules(self, cfg_token='ana0'):
+        self.camera.remote_call()
+        return [self._rule()]
+
+    def get_rule_by_name(self, rule_name, cfg_token='ana0'):
+        self.camera.remote_call()
+        if rule_name != TAMPER_RULE_NAME:
+            raise soap_fault('No rule named %s' % rule_name)
+        return self._rule()
+
+    def modify_rules(self, cfg_token, *rules):
+        self.camera.remote_call()
+        updates = {}
+        for rule in rules:
+            for param in rule.Parameters.SimpleItem:
+                name, value = param['_Name'], param['_Value']
+                low, high = TAMPER_BOUNDS[name][:2]
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise soap_fault('Invalid value %r for %s' % (value, name))
+                if not low <= value <= high:
+                    raise soap_fault('Value %s for %s out of range %s..%s' % (value, name, low, high))
+                updates[name] = value
+        self.settings.update(updates)
+
+    def delete_rules(self, rule_name, cfg_token='ana0'):
+        self.camera.remote_call()
+        raise soap_fault('Rule %s can not be deleted' % rule_name)
+
+
+class SimulatedWebServiceClient(object):
+    def __init__(self, camera):
+        self.camera = camera
+
+    def _get(self, name):
+        self.camera.remote_call()
+        return self.camera.analytics_client.settings[name]
+
+    def _set(self, name, value):
+        self.camera.remote_call()
+        low, high = TAMPER_BOUNDS[name][:2]
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return 400, 'Invalid value'
+        if not low <= value <= high:
+            return 400, 'Value out of range'
+        self.camera.analytics_client.settings[name] = value
+        return 200, 'OK'
+
+    def get_tamper_sensitivity(self):
+        return self._get('Sensitivity')
+
+    def get_tamper_min_sensitivity(self):
+        self.camera.remote_call()
+        return TAMPER_BOUNDS['Sensitivity'][0]
+
+    def get_tamper_max_sensitivity(self):
+        self.camera.remote_call()
+        return TAMPER_BOUNDS['Sensitivity'][1]
+
+    def set_tamper_sensitivity(self, sensitivity):
+        return self._set('Sensitivity', sensitivity)
+
+    def get_tamper_trigger_delay(self):
+        return self._get('Duration')
+
+    def get_tamper_min_trigger_delay(self):
+        self.camera.remote_call()
+        return TAMPER_BOUNDS['Duration'][0]
+
+    def get_tamper_max_trigger_delay(self):
+        self.camera.remote_call()
+        return TAMPER_BOUNDS['Duration'][1]
+
+    def set_tamper_trigger_delay(self, trigger_delay):
+        return self._set('Duration', trigger_delay)
+
+
+class SimulatedCamera(object):
+    def __init__(self, user='admin', password='admin', ip='127.0.0.1', latency=0.0, jitter=0.0,
+                 failure_rate=0.0, reboot_time=1.0, val_exception_rate=0.0, move_speed=0.5, seed=None,
+                 model='H4A-SIM', firmware='0.0.0.sim', arguments=None):
+        """
+        :param latency: mean seconds added to every remote call
+        :param jitter: maximum +- seconds of random variation around latency
+        :param failure_rate: probability of a remote call raising SimulatedFailure
+        :param reboot_time: seconds reboot() and set_factory_defaults() take
+        :param val_exception_rate: probability of gss() logging a VAL::EXCEPTION
+        :param move_speed: PTZ units per second
+        :param seed: random seed, defaults to a value derived from ip
+        """
+        self.ip = ip
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reboot_time = reboot_time
+        self.val_exception_rate = val_exception_rate
+        self.rng = random.Random(ip if seed is None else seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.boot_time = time.time() - self.rng.randint(0, 30 * 86400)
+        self.system_log = []
+        self.home = (0.0, 0.0, 0.0)
+        self.arguments = {'wait': 0, 'repeat': 1} if arguments is None else arguments
+        self.no_video_list = []
+        self.cp = SudsObject(props={'Model': model, 'FirmwareVersion': firmware, 'HardwareId': 'SIM'},
+                             logger=None)
+        self.logger = SimulatedLogger('sim_camera.%s' % ip)
+        self.cp.logger = self.logger
+        self.camera_log = SimulatedCameraLog(self)
+        self.avigilon_client = SimulatedAvigilonClient(self)
+        self.ptz_client = SimulatedPtzClient(self, move_speed)
+        self.analytics_client = SimulatedAnalyticsClient(self)
+        self.web_service_client = SimulatedWebServiceClient(self)
+        self.event_client = SudsObject()
+
+    def remote_call(self):
+        """
+        Simulate network latency and failures of one request
+        """
+        with self.lock:
+            self.calls += 1
+            delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0)
+            failed = self.rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise SimulatedFailure('Simulated failure of camera %s' % self.ip)
+
+    def add_log(self, line):
+        with self.lock:
+            self.system_log.append('%s %s' % (time.strftime('%Y-%m-%d %H:%M:%S'), line))
+
+    def create_event_client(self):
+        self.event_client = SudsObject()
+
+    def create_avigilon_client(self):
+        self.avigilon_client = SimulatedAvigilonClient(self)
+
+    def init_camera_log(self):
+        self.camera_log = SimulatedCameraLog(self)
+
+    def get_camera_log(self):
+        return SimulatedCameraLog(self)
+
+    def process_camera_logs(self, test_name):
+        self.logger.info('Processed %d camera log lines for %s' % (len(self.system_log), test_name))
+
+    def _restart(self):
+        self.remote_call()
+        time.sleep(self.reboot_time)
+        self.boot_time = time.time()
+        self.add_log('Camera booted')
+        self.avigilon_client.goto_ptz_home()
+        self.add_log('CreateStream' if 'G-' in self.cp.props['Model'] else 'PlayStream')
+
+    def reboot(self):
+        self._restart()
+
+    def set_factory_defaults(self):
+        self.analytics_client.reset()
+        self._restart()
+
+
+def simulated_camera_factory(**options):
+    """
+    :param options: SimulatedCamera keyword arguments (latency, jitter, failure_rate, ...)
+    :return: callable(user, password, ip) usable as CameraPool camera_factory
+    """
+    def factory(user, password, ip):
+        return SimulatedCamera(user, password, ip, **options)
+    return factory
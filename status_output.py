@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Streaming writers for camera status rows
+----------------------------------------
+
+Each row is written and flushed as soon as a camera completes, so output is
+visible during the sweep and memory does not grow with fleet size.
+
+Usage:
+    writer = make_writer('ndjson', sys.stdout, HEADERS)
+    writer.write(row)
+"""
+import csv
+import json
+
+
+class NdjsonWriter(object):
+    """
+    One JSON object per line, keys taken from headers
+    """
+    def __init__(self, stream, headers):
+        self.stream = stream
+        self.headers = headers
+
+    def write(self, row):
+        self.stream.write(json.dumps(dict(zip(self.headers, row)), sort_keys=True) + '\n')
+        self.stream.flush()
+
+
+class CsvWriter(object):
+    """
+    CSV with a header line
+    """
+    def __init__(self, stream, headers):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(headers)
+        self.stream.flush()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.stream.flush()
+
+
+WRITERS = {'ndjson': NdjsonWriter,
+           'csv': CsvWriter}
+
+
+def make_writer(fmt, stream, headers):
+    """
+    :param fmt: 'ndjson' or 'csv'
+    :param stream: file object rows are written to
+    :param headers: column names
+    :return: writer with write(row) method
+    """
+    if fmt not in WRITERS:
+        raise ValueError("Unknown output format %s, expected one of %s" % (fmt, ', '.join(sorted(WRITERS))))
+    return WRITERS[fmt](stream, headers)
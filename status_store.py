@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+SQLite time series store for camera status samples
+--------------------------------------------------
+
+Samples are buffered and written with one executemany() per batch, so a
+fleet sweep costs one transaction instead of one per camera.
+
+Usage:
+    store = StatusStore('camera_status.db')
+    store.add(time.time(), ip, gss_status, val_exception)
+    store.flush()
+    for row in store.query(ip, since=time.time() - 86400): ...
+"""
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts REAL NOT NULL,
+    ip TEXT NOT NULL,
+    uptime INTEGER,
+    sys_cpu REAL,
+    proc_cpu REAL,
+    sys_mem REAL,
+    val_service TEXT,
+    val_exception TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_ip_ts ON samples (ip, ts);
+"""
+
+INSERT = "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class StatusStore(object):
+    def __init__(self, path, batch_size=500):
+        """
+        :param path: SQLite database file
+        :param batch_size: number of buffered samples that triggers a flush
+        """
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def add(self, ts, ip, status, val_exception):
+        """
+        Buffer one sample
+        :param ts: sample time (seconds since epoch)
+        :param ip: camera IP
+        :param status: gss_parser.GssStatus
+        :param val_exception: VAL exception log line or "NONE"
+        """
+        sys_cpu = status.sys_cpu[0] if status.sys_cpu else None
+        self.pending.append((ts, ip, status.uptime, sys_cpu, status.proc_cpu, status.sys_mem,
+                             status.val_service, val_exception))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered samples in one transaction
+        """
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany(INSERT, self.pending)
+        self.pending = []
+
+    def query(self, ip, since=0, until=None):
+        """
+        Samples of one camera in a time range, oldest first
+        :return: list of sample tuples
+        """
+        if until is None:
+            until = float('inf')
+        return self.db.execute("SELECT * FROM samples WHERE ip = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                               (ip, since, until)).fetchall()
+
+    def close(self):
+        self.flush()
+        self.db.close()
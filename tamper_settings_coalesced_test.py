@@ -0,0 +1,52 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+"""
+Summary
+========================================================
+Tamper settings persistence and restore defaults tests of the ONVIF and Web
+API modules with one reboot and one factory reset for all of them
+
+Run with the 'coalesce_reboots' argument, test_tamper_settings of both modules
+then leaves these tests to this module.
+-------------------
+JIRA - FWPRD-369, FWPRD-370
+"""
+import pytest
+from CameraController.device.camera import Camera
+from cassette import cassette_for
+from reboot_scheduler import RebootScheduler, REBOOT, FACTORY_DEFAULTS
+import tamper_settings_onvif_test
+import tamper_settings_web_test
+
+
+@pytest.mark.regression
+@pytest.mark.tamper
+def test_tamper_settings_coalesced(camera):
+    if not camera.arguments.get('coalesce_reboots'):
+        pytest.skip('Persistence and restore defaults run in each tamper settings module')
+    if camera.cp.props['HardwareId'] in camera.no_video_list:
+        camera.logger.info('Camera Tamper is not supported on T%s' % camera.cp.props['HardwareId'])
+        pytest.skip('Camera Tamper is not supported on T%s' % camera.cp.props['HardwareId'])
+    camera.init_camera_log()
+    # 'cassette' argument records or replays the client calls of the test
+    cassette = cassette_for(camera)
+    camera.logger.test_start_header('Starting coalesced camera tamper persistence and restore defaults test')
+
+    # restarts also drop the cached ONVIF rule descriptions and snapshots of the camera
+    tamper_settings_onvif_test.watch_restarts(camera)
+    scheduler = RebootScheduler(camera)
+    for module in (tamper_settings_onvif_test, tamper_settings_web_test):
+        module.tamper_settings_persistence_test(camera, scheduler)
+        module.tamper_restore_defaults_test(camera, scheduler)
+    scheduler.run()
+    camera.logger.info('%d tests with %d reboot(s) and %d factory reset(s)'
+                       % (scheduler.tests, scheduler.performed[REBOOT], scheduler.performed[FACTORY_DEFAULTS]))
+
+    camera.process_camera_logs('TAMPER COALESCED TEST')
+    if cassette is not None:
+        cassette.close()
+    assert camera.logger.get_fail_count() == 0
+
+
+if __name__ == '__main__':
+    test_tamper_settings_coalesced(Camera())
@@ -25,8 +25,14 @@ References:
 -------------------
 JIRA - FWPRD-369, FWTESTPOOL-529
 """
+import copy
+import weakref
 import pytest
 from CameraController.device.camera import Camera
+from camera_log_store import process_new_logs
+from cassette import cassette_for
+from reboot_scheduler import RebootScheduler, REBOOT, FACTORY_DEFAULTS
+from range_verification import RangeVerifier
 from suds import WebFault
 
 TAMPER_DEFAULTS = {'Duration': {'Default': 8, 'Max': 30, 'Min': 1},
@@ -66,28 +72,172 @@ def test_tamper_settings(camera):
         pytest.skip('Camera Tamper is not supported on T%s' % camera.cp.props['HardwareId'])
         return 0
     camera.init_camera_log()
+    # 'cassette' argument records or replays the client calls of the test
+    cassette = cassette_for(camera)
+    watch_restarts(camera)
     camera.logger.test_start_header('Starting camera tamper settings test')
 
-    tamper_sensitivity_range_test(camera)
-    tamper_trigger_delay_range_test(camera)
-    tamper_settings_persistence_test(camera)
-    tamper_restore_defaults_test(camera)
+    if camera.arguments.get('range_strategy'):
+        tamper_ranges_test(camera)
+    else:
+        tamper_sensitivity_range_test(camera)
+        tamper_trigger_delay_range_test(camera)
+    if not camera.arguments.get('coalesce_reboots'):
+        # otherwise run by tamper_settings_coalesced_test.py with one reboot and one reset for all modules
+        tamper_settings_persistence_test(camera)
+        tamper_restore_defaults_test(camera)
     tamper_delete_rule_test(camera)
     # TODO: uncomment when VAL-1482 is fixed
     # tamper_invalid_sensitivity_test(camera)
     # tamper_invalid_trigger_delay_test(camera)
 
+    if camera.arguments.get('log_dir'):
+        # keep the lines of this test in the soak log store for later queries,
+        # process_camera_logs() below checks them
+        process_new_logs(camera, 'TAMPER WEB API TEST', camera.arguments['log_dir'])
     camera.process_camera_logs('TAMPER WEB API TEST')
+    if cassette is not None:
+        cassette.close()
+    camera.logger.info('Supported rule cache: %d hits, %d misses' % rule_descriptions.stats(camera))
     assert camera.logger.get_fail_count() == 0
 
 
+class RuleDescriptionCache(object):
+    """
+    Supported rule descriptions of each camera, per rule name.
+    Bounds and defaults do not change while the camera runs the same firmware. A new
+    firmware only runs after a restart, and the props firmware version is read once,
+    so the entries of a camera are dropped on every restart (see watch_restarts()).
+    """
+    def __init__(self):
+        self.rules = weakref.WeakKeyDictionary()
+        self.counts = weakref.WeakKeyDictionary()
+
+    def get(self, camera, rule_name, fetch):
+        """
+        :param fetch: callable(camera, rule_name) used on a miss
+        """
+        rules = self.rules.setdefault(camera, {})
+        counts = self.counts.setdefault(camera, [0, 0])
+        if rule_name in rules:
+            counts[0] += 1
+        else:
+            counts[1] += 1
+            rules[rule_name] = fetch(camera, rule_name)
+        return rules[rule_name]
+
+    def invalidate(self, camera):
+        self.rules.pop(camera, None)
+
+    def stats(self, camera):
+        """
+        :return: (hits, misses) of camera
+        """
+        return tuple(self.counts.get(camera, (0, 0)))
+
+
+rule_descriptions = RuleDescriptionCache()
+
+
+class RuleSnapshot(object):
+    """
+    Configured rules of a camera from one GetRules request, indexed by rule name and parameter name
+    """
+    def __init__(self, rules):
+        """
+        :param rules: rule objects returned by analytics_client.get_rules()
+        """
+        self.rules = {}
+        self.items = {}
+        self.values = {}
+        for rule in rules:
+            self.rules[rule['_Name']] = rule
+            self.items[rule['_Name']] = dict((param['_Name'], param) for param in rule.Parameters.SimpleItem)
+            self.values[rule['_Name']] = dict((param['_Name'], param['_Value'])
+                                              for param in rule.Parameters.SimpleItem)
+
+    def get(self, rule_name):
+        """
+        :return: copy of the dictionary with rule items and their values, None if there is no such rule
+        """
+        values = self.values.get(rule_name)
+        return None if values is None else dict(values)
+
+    def diff(self, other):
+        """
+        Parameters changed from this snapshot to a newer one
+        :param other: newer RuleSnapshot
+        :return: dictionary rule name -> {parameter name: (old value, new value)}, None for a missing rule or value
+        """
+        changes = {}
+        for rule_name in set(self.values) | set(other.values):
+            old, new = self.values.get(rule_name, {}), other.values.get(rule_name, {})
+            changed = dict((name, (old.get(name), new.get(name))) for name in set(old) | set(new)
+                           if old.get(name) != new.get(name))
+            if changed:
+                changes[rule_name] = changed
+        return changes
+
+
+# latest RuleSnapshot of each camera, dropped on every write so the next read fetches the rules again
+snapshots = weakref.WeakKeyDictionary()
+
+
+def rule_snapshot(camera):
+    watch_restarts(camera)
+    snapshot = snapshots.get(camera)
+    if snapshot is None:
+        snapshot = snapshots[camera] = RuleSnapshot(camera.analytics_client.get_rules())
+    return snapshot
+
+
+# camera methods after which cached rule descriptions and snapshots are stale
+RESTART_METHODS = ('reboot', 'set_factory_defaults')
+watched = weakref.WeakKeyDictionary()
+
+
+def forget(camera):
+    rule_descriptions.invalidate(camera)
+    snapshots.pop(camera, None)
+
+
+def watch_restarts(camera):
+    """
+    Wrap reboot() and set_factory_defaults() of the camera object so every restart drops its
+    cached rule descriptions and snapshot, also when other tests or RebootScheduler call them
+    """
+    if camera in watched:
+        return
+    watched[camera] = True
+    for name in RESTART_METHODS:
+        setattr(camera, name, _forgetting(camera, getattr(camera, name)))
+
+
+def _forgetting(camera, restart):
+    def restart_and_forget(*args, **kwargs):
+        forget(camera)
+        try:
+            return restart(*args, **kwargs)
+        finally:
+            forget(camera)
+    return restart_and_forget
+
+
 def get_supported_rule_by_name(camera, rule_name='tavg:CameraTampering'):
     """
-    Get supported rule options for a given rule name
+    Get supported rule options for a given rule name, cached in rule_descriptions
     :param camera: Camera object
     :param rule_name: Name of supported rule
     :return: dictionary with Min, Max and Default values for each rule item
     """
+    watch_restarts(camera)
+    return rule_descriptions.get(camera, rule_name, fetch_supported_rule_by_name)
+
+
+def fetch_supported_rule_by_name(camera, rule_name):
+    """
+    Request supported rule options for a given rule name from the camera
+    """
     rule_dict = {}
 
     rule = camera.analytics_client.get_supported_rule_by_name(rule_name)
@@ -102,18 +252,11 @@ def get_supported_rule_by_name(camera, rule_name='tavg:CameraTampering'):
 
 def get_rules(camera):
     """
-    Get current settings for a all configured rules
+    Get current settings for a all configured rules, from the rule snapshot of the camera
     :param camera: Camera object
-    :return: dictionary with rule items and its current values for each rule
+    :return: dictionary with rule items and its current values for each rule, a copy the caller may change
     """
-    rules_dict = {}
-
-    rules = camera.analytics_client.get_rules()
-    for rule in rules:
-        for param in rule.Parameters.SimpleItem:
-            rules_dict.setdefault(rule['_Name'], {}).update({param['_Name']: param['_Value']})
-
-    return rules_dict
+    return copy.deepcopy(rule_snapshot(camera).values)
 
 
 def get_rule_by_name(camera, rule_name='Camera Tampering Rule'):
@@ -141,13 +284,19 @@ def modify_rule(camera, rule_name, params, cfg_token='ana0'):
     :param cfg_token: configuration token, dfault - 'ana0'
     :return: HTTP code - HTTP OK (200) if no errors, SERVER ERROR (500) otherwise
     """
-    rule = camera.analytics_client.get_rule_by_name(rule_name, cfg_token)
+    snapshot = rule_snapshot(camera) if cfg_token == 'ana0' else None
+    if snapshot is not None and rule_name in snapshot.rules:
+        # reuse the rule fetched by the last read, the snapshot is dropped below after the write
+        rule, items = snapshot.rules[rule_name], snapshot.items[rule_name]
+    else:
+        rule = camera.analytics_client.get_rule_by_name(rule_name, cfg_token)
+        items = dict((param['_Name'], param) for param in rule.Parameters.SimpleItem)
 
     num_params_set = 0
-    for param in rule.Parameters.SimpleItem:
-        if param['_Name'] in params.keys():
+    for name, value in params.items():
+        if name in items:
             num_params_set += 1
-            param['_Value'] = params[param['_Name']]
+            items[name]['_Value'] = value
 
     if num_params_set != len(params):
         camera.cp.logger.warning("Some parameters for rule %s may not have been set!" % rule_name)
@@ -157,6 +306,8 @@ def modify_rule(camera, rule_name, params, cfg_token='ana0'):
         return HTTP_OK
     except WebFault:
         return SOAP_FAULT
+    finally:
+        snapshots.pop(camera, None)
 
 
 def get_tamper_sensitivity(camera):
@@ -226,6 +377,34 @@ def get_tamper_default_timeout(camera):
     return int(tamper_rule['Timeout']['Default'])
 
 
+def verify_rule_ranges(camera, ranges, strategy='exhaustive', rule_name='Camera Tampering Rule'):
+    """
+    Set values of rule parameter ranges and verify they read back, several parameters per request
+    :param ranges: dictionary with parameter name and (min, max) range, for example {'Sensitivity': (1, 10)}
+    :param strategy: 'exhaustive', 'sampled' or 'bisect', see range_verification.py
+    :return: dictionary with parameter name and RangeReport
+    """
+    def write(params):
+        return modify_rule(camera, rule_name, params) == HTTP_OK
+
+    def read():
+        rule = get_rule_by_name(camera, rule_name) or {}
+        return dict((name, int(value)) for name, value in rule.items() if name in ranges)
+
+    verifier = RangeVerifier(write, read)
+    reports = verifier.verify(ranges, strategy, camera.arguments.get('range_samples', 32),
+                              camera.arguments.get('seed', 0))
+    for name in sorted(reports):
+        report = reports[name]
+        for value in sorted(report.failures):
+            camera.logger.logresult(False, "Current tamper %s is %s (expected %s)"
+                                    % (name, report.failures[value], value))
+        camera.logger.logresult(not report.failures, report.format())
+    camera.logger.info("Verified %s in %d requests, %.1f s" % (', '.join(sorted(ranges)), verifier.requests,
+                                                              verifier.elapsed))
+    return reports
+
+
 def set_tamper_sensitivity(camera, sensitivity):
     rule = {'Sensitivity': sensitivity}
     return modify_rule(camera, 'Camera Tampering Rule', rule)
@@ -261,12 +440,8 @@ def tamper_sensitivity_range_test(camera):
                             % (max_sensitivity, MAX_TAMPER_SENSITIVITY))
 
     # Test valid sensitivity range
-    for sensitivity_to_set in range(min_sensitivity, max_sensitivity + 1):
-        set_tamper_sensitivity(camera, sensitivity_to_set)
-        sensitivity = get_tamper_sensitivity(camera)
-        camera.logger.logresult(sensitivity == sensitivity_to_set,
-                                "Current tamper sensitivity is %s (expected %s)"
-                                % (sensitivity, sensitivity_to_set))
+    verify_rule_ranges(camera, {'Sensitivity': (min_sensitivity, max_sensitivity)},
+                       camera.arguments.get('range_strategy', 'exhaustive'))
 
 
 def tamper_trigger_delay_range_test(camera):
@@ -285,12 +460,8 @@ def tamper_trigger_delay_range_test(camera):
                             % (max_trigger_delay, MAX_TAMPER_TRIGGER_DELAY))
 
     # Test valid trigger delay range
-    for trigger_delay_to_set in range(min_trigger_delay, max_trigger_delay + 1):
-        set_tamper_trigger_delay(camera, trigger_delay_to_set)
-        trigger_delay = get_tamper_trigger_delay(camera)
-        camera.logger.logresult(trigger_delay == trigger_delay_to_set,
-                                "Current tamper sensitivity is %s (expected %s)"
-                                % (trigger_delay, trigger_delay_to_set))
+    verify_rule_ranges(camera, {'Duration': (min_trigger_delay, max_trigger_delay)},
+                       camera.arguments.get('range_strategy', 'exhaustive'))
 
 
 def tamper_timeout_range_test(camera):
@@ -309,16 +480,47 @@ def tamper_timeout_range_test(camera):
                             % (max_timeout_delay, MAX_TAMPER_TRIGGER_DELAY))
 
     # Test valid timeout range
-    for timeout_to_set in range(min_timeout_delay, max_timeout_delay + 1):
-        set_tamper_timeout(camera, timeout_to_set)
-        timeout = get_tamper_trigger_delay(camera)
-        camera.logger.logresult(timeout == timeout_to_set,
-                                "Current tamper timeout is %s (expected %s)"
-                                % (timeout, timeout_to_set))
+    verify_rule_ranges(camera, {'Timeout': (min_timeout_delay, max_timeout_delay)},
+                       camera.arguments.get('range_strategy', 'exhaustive'))
+
+
+def tamper_ranges_test(camera):
+    """
+    Check min and max of sensitivity, trigger delay and timeout and verify the three ranges
+    together with camera.arguments['range_strategy'], one ModifyRules and one GetRules per step
+    """
+    camera.logger.test_start_header("Testing min, max, and valid ranges of tamper sensitivity, trigger delay "
+                                    "and timeout.")
+    expected = {'Sensitivity': (MIN_TAMPER_SENSITIVITY, MAX_TAMPER_SENSITIVITY),
+                'Duration': (MIN_TAMPER_TRIGGER_DELAY, MAX_TAMPER_TRIGGER_DELAY),
+                'Timeout': (MIN_TAMPER_TIMEOUT, MAX_TAMPER_TIMEOUT)}
+    tamper_rule = get_supported_rule_by_name(camera)
+    ranges = {}
+    for name in sorted(expected):
+        bounds = (int(tamper_rule[name]['Min']), int(tamper_rule[name]['Max']))
+        camera.logger.logresult(bounds == expected[name], "Tamper %s range is %s..%s (expected %s..%s)"
+                                % ((name,) + bounds + expected[name]))
+        ranges[name] = bounds
 
+    verify_rule_ranges(camera, ranges, camera.arguments['range_strategy'])
 
-def tamper_settings_persistence_test(camera):
+
+def tamper_settings_persistence_test(camera, scheduler=None):
+    """
+    :param scheduler: RebootScheduler shared with other tests, the test runs right away if None
+    """
     camera.logger.test_start_header("Testing settings persistence for tamper sensitivity and trigger delay.")
+    run_now = scheduler is None
+    if run_now:
+        scheduler = RebootScheduler(camera)
+    scheduler.add(REBOOT, 'ONVIF tamper settings persistence',
+                  lambda: tamper_settings_persistence_setup(camera),
+                  lambda: tamper_settings_persistence_check(camera))
+    if run_now:
+        scheduler.run()
+
+
+def tamper_settings_persistence_setup(camera):
     camera.logger.info("Setting Non-Default Values")
 
     # Set MAX sensitivity
@@ -345,9 +547,8 @@ def tamper_settings_persistence_test(camera):
                             "Current tamper timeout is %s (expected %s)"
                             % (timeout, MAX_TAMPER_TIMEOUT))
 
-    camera.logger.info("Rebooting Camera")
-    camera.reboot()
 
+def tamper_settings_persistence_check(camera):
     sensitivity = get_tamper_sensitivity(camera)
     camera.logger.logresult(sensitivity == MAX_TAMPER_SENSITIVITY,
                             "Tamper sensitivity after reboot is: %s (expected %s)"
@@ -361,11 +562,25 @@ def tamper_settings_persistence_test(camera):
     timer = get_tamper_timeout(camera)
     camera.logger.logresult(timer == MAX_TAMPER_TIMEOUT,
                             "Tamper timeout after reboot is: %s (expected %s)"
-                            % (trigger_delay, MAX_TAMPER_TRIGGER_DELAY))
+                            % (timer, MAX_TAMPER_TIMEOUT))
 
 
-def tamper_restore_defaults_test(camera):
+def tamper_restore_defaults_test(camera, scheduler=None):
+    """
+    :param scheduler: RebootScheduler shared with other tests, the test runs right away if None
+    """
     camera.logger.test_start_header("Testing restore to defaults for tamper sensitivity and trigger delay.")
+    run_now = scheduler is None
+    if run_now:
+        scheduler = RebootScheduler(camera)
+    scheduler.add(FACTORY_DEFAULTS, 'ONVIF tamper restore defaults',
+                  lambda: tamper_restore_defaults_setup(camera),
+                  lambda: tamper_restore_defaults_check(camera))
+    if run_now:
+        scheduler.run()
+
+
+def tamper_restore_defaults_setup(camera):
     camera.logger.info("Setting Non-Default Values")
 
     # Set MAX sensitivity
@@ -399,9 +614,8 @@ def tamper_restore_defaults_test(camera):
                             "Current enabled value is %s (expected %s)"
                             % (enabled, 0))
 
-    camera.logger.info("Restoring factory defaults")
-    camera.set_factory_defaults()
 
+def tamper_restore_defaults_check(camera):
     sensitivity = get_tamper_sensitivity(camera)
     camera.logger.logresult(sensitivity == DEFAULT_TAMPER_SENSITIVITY,
                             "Tamper sensitivity after restored factory defaults is: %s (expected %s)"
@@ -492,16 +706,21 @@ def tamper_invalid_trigger_delay_test(camera):
 def tamper_delete_rule_test(camera):
     camera.logger.test_start_header("Testing tampering rule deletion")
 
+    before = rule_snapshot(camera)
     try:
         camera.analytics_client.delete_rules('Camera Tampering Rule')
         camera.logger.logresult(False, 'No error when delete Camera Tampering Rule')
     except WebFault as e:
         camera.logger.info(e.message)
         camera.logger.logresult(True, 'Unable to delete Camera Tampering Rule')
+    finally:
+        snapshots.pop(camera, None)
 
     try:
-        get_rule_by_name(camera, 'Camera Tampering Rule')
-        camera.logger.logresult(True, 'CameraTampering Rule still exists')
+        camera.logger.logresult(get_rule_by_name(camera, 'Camera Tampering Rule') is not None,
+                                'CameraTampering Rule still exists')
+        changes = before.diff(rule_snapshot(camera))
+        camera.logger.logresult(not changes, 'Rules unchanged by failed delete: %s' % (changes or 'no changes'))
     except WebFault as e:
         camera.logger.info(e.message)
         camera.logger.logresult(False, 'Unable to retrieve Camera Tampering Rule settings')
@@ -18,6 +18,9 @@ JIRA - FWPRD-370, FWTESTPOOL-534
 """
 import pytest
 from CameraController.device.camera import Camera
+from camera_log_store import process_new_logs
+from cassette import cassette_for
+from reboot_scheduler import RebootScheduler, REBOOT, FACTORY_DEFAULTS
 
 MIN_TAMPER_SENSITIVITY = 1
 MAX_TAMPER_SENSITIVITY = 10
@@ -39,17 +42,27 @@ def test_tamper_settings(camera):
         pytest.skip('Camera Tamper is not supported on T%s' % camera.cp.props['HardwareId'])
         return 0
     camera.init_camera_log()
+    # 'cassette' argument records or replays the client calls of the test
+    cassette = cassette_for(camera)
     camera.logger.test_start_header('Starting camera tamper settings test')
 
     tamper_sensitivity_range_test(camera)
     tamper_trigger_delay_range_test(camera)
-    tamper_settings_persistence_test(camera)
-    tamper_restore_defaults_test(camera)
+    if not camera.arguments.get('coalesce_reboots'):
+        # otherwise run by tamper_settings_coalesced_test.py with one reboot and one reset for all modules
+        tamper_settings_persistence_test(camera)
+        tamper_restore_defaults_test(camera)
     # TODO: uncomment when VAL-1482 is fixed
     # tamper_invalid_sensitivity_test(camera)
     # tamper_invalid_trigger_delay_test(camera)
 
+    if camera.arguments.get('log_dir'):
+        # keep the lines of this test in the soak log store for later queries,
+        # process_camera_logs() below checks them
+        process_new_logs(camera, 'TAMPER WEB API TEST', camera.arguments['log_dir'])
     camera.process_camera_logs('TAMPER WEB API TEST')
+    if cassette is not None:
+        cassette.close()
     assert camera.logger.get_fail_count() == 0
 
 
@@ -100,8 +113,22 @@ def tamper_trigger_delay_range_test(camera):
                                 % (trigger_delay, trigger_delay_to_set))
 
 
-def tamper_settings_persistence_test(camera):
+def tamper_settings_persistence_test(camera, scheduler=None):
+    """
+    :param scheduler: RebootScheduler shared with other tests, the test runs right away if None
+    """
     camera.logger.test_start_header("Testing settings persistence for tamper sensitivity and trigger delay.")
+    run_now = scheduler is None
+    if run_now:
+        scheduler = RebootScheduler(camera)
+    scheduler.add(REBOOT, 'Web API tamper settings persistence',
+                  lambda: tamper_settings_persistence_setup(camera),
+                  lambda: tamper_settings_persistence_check(camera))
+    if run_now:
+        scheduler.run()
+
+
+def tamper_settings_persistence_setup(camera):
     camera.logger.info("Setting Non-Default Values")
 
     # Set MAX sensitivity
@@ -120,9 +147,8 @@ def tamper_settings_persistence_test(camera):
                             "Current tamper sensitivity is %s (expected %s)"
                             % (trigger_delay, MAX_TAMPER_TRIGGER_DELAY))
 
-    camera.logger.info("Rebooting Camera")
-    camera.reboot()
 
+def tamper_settings_persistence_check(camera):
     sensitivity = camera.web_service_client.get_tamper_sensitivity()
     camera.logger.logresult(sensitivity == MAX_TAMPER_SENSITIVITY,
                             "Tamper sensitivity after reboot is: %s (expected %s)"
@@ -134,8 +160,22 @@ def tamper_settings_persistence_test(camera):
                             % (trigger_delay, MAX_TAMPER_TRIGGER_DELAY))
 
 
-def tamper_restore_defaults_test(camera):
+def tamper_restore_defaults_test(camera, scheduler=None):
+    """
+    :param scheduler: RebootScheduler shared with other tests, the test runs right away if None
+    """
     camera.logger.test_start_header("Testing restore to defaults for tamper sensitivity and trigger delay.")
+    run_now = scheduler is None
+    if run_now:
+        scheduler = RebootScheduler(camera)
+    scheduler.add(FACTORY_DEFAULTS, 'Web API tamper restore defaults',
+                  lambda: tamper_restore_defaults_setup(camera),
+                  lambda: tamper_restore_defaults_check(camera))
+    if run_now:
+        scheduler.run()
+
+
+def tamper_restore_defaults_setup(camera):
     camera.logger.info("Setting Non-Default Values")
 
     # Set MAX sensitivity
@@ -154,9 +194,8 @@ def tamper_restore_defaults_test(camera):
                             "Current tamper sensitivity is %s (expected %s)"
                             % (trigger_delay, MAX_TAMPER_TRIGGER_DELAY))
 
-    camera.logger.info("Restoring factory defaults")
-    camera.set_factory_defaults()
 
+def tamper_restore_defaults_check(camera):
     sensitivity = camera.web_service_client.get_tamper_sensitivity()
     camera.logger.logresult(sensitivity == DEFAULT_TAMPER_SENSITIVITY,
                             "Tamper sensitivity after restored factory defaults is: %s (expected %s)"